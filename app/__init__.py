@@ -1,3 +1,15 @@
 from .task import Task
-from .tracker import TaskTracker
-from .graph import Graph
+from .tracker import SAVE_FORMATS, TaskTracker, detect_format
+from .journal import Journal
+from .autosave import AutoSaver
+from .sqlite_store import SQLiteStore
+from .rollup import RetentionPolicy
+from .activity import ActivityIndex
+
+
+def __getattr__(name):
+    # the graph pulls in matplotlib and Qt, only import it when used
+    if name == 'Graph':
+        from .graph import Graph
+        return Graph
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
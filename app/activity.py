@@ -0,0 +1,225 @@
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from .task import Task, to_timestamp
+from .tracker import TaskTracker
+
+
+def _key(task: Task) -> Tuple[int, int, str]:
+    # most recently active first, tasks without history last, then by name
+    timestamp = task.last_timestamp
+    if timestamp is None:
+        return (1, 0, task.name)
+    return (0, -timestamp, task.name)
+
+
+class ActivityIndex:
+    def __init__(self, tracker: TaskTracker):
+        """
+        Index of the tasks of a task tracker by recent activity, the time of
+        their newest history entry, most recent first. Kept up to date from
+        the change records of the task tracker once attached, so that a page
+        of it can be read without sorting every task.
+
+        Args:
+            tracker (TaskTracker): Task tracker to index.
+
+        """
+        self.tracker = tracker
+
+        # sorted keys (see '_key'), and the key of each task by name
+        self._order: List[Tuple[int, int, str]] = []
+        self._keys = {}
+
+        self._attached = False
+
+    def attach(self) -> None:
+        """
+        Index the task tracker, and keep the index up to date on every change.
+
+        """
+        with self.tracker.lock:
+            self.rebuild()
+            if not self._attached:
+                self.tracker.add_listener(self.apply)
+                self._attached = True
+
+    def detach(self) -> None:
+        """
+        Stop updating the index.
+
+        """
+        if self._attached:
+            self.tracker.remove_listener(self.apply)
+            self._attached = False
+
+    def rebuild(self) -> None:
+        """
+        Index all the tasks again.
+
+        """
+        with self.tracker.lock:
+            self._keys = {task.name: _key(task) for task in self.tracker.tasks}
+            self._order = sorted(self._keys.values())
+
+    def refresh(self, names: Iterable[str]) -> None:
+        """
+        Index some tasks again, e.g. after changes that are not notified (see
+        'TaskTracker.merge').
+
+        Args:
+            names (Iterable[str]): Names of the tasks to index again.
+
+        """
+        with self.tracker.lock:
+            for name, key in self.refreshed(names):
+                self.update(name, key)
+
+    def apply(self, records: List[dict]) -> None:
+        """
+        Update the index with change records. Registered as a task tracker
+        listener by 'attach'.
+
+        Args:
+            records (List[dict]): Change records.
+
+        """
+        with self.tracker.lock:
+            for record in records:
+                for name, key in self.updates([record]):
+                    self.update(name, key)
+
+    def refreshed(self, names: Iterable[str]) -> List[Tuple[str, Optional[tuple]]]:
+        """
+        Get the keys some tasks are indexed by again (see 'refresh'), without
+        updating the index.
+
+        Args:
+            names (Iterable[str]): Names of the tasks to index again.
+
+        Returns (List[Tuple[str, Optional[tuple]]]): Task names and their new
+            keys, None for the tasks to remove.
+
+        """
+        with self.tracker.lock:
+            result = []
+            for name in names:
+                task = self.tracker.get_task(name)
+                result.append((name, _key(task) if task is not None else None))
+            return result
+
+    def updates(self, records: List[dict]) -> List[Tuple[str, Optional[tuple]]]:
+        """
+        Get the keys change records move tasks to (see 'apply'), without
+        updating the index. Records are expected to be applied one at a time.
+
+        Args:
+            records (List[dict]): Change records.
+
+        Returns (List[Tuple[str, Optional[tuple]]]): Task names and their new
+            keys, None for the tasks to remove.
+
+        """
+        result = []
+        with self.tracker.lock:
+            for record in records:
+                op, name = record["op"], record.get("name")
+                if op == "add":
+                    task = self.tracker.get_task(record["task"]["name"])
+                    if task is not None:
+                        result.append((task.name, _key(task)))
+                elif op == "remove":
+                    result.append((name, None))
+                elif op == "increment" and name in self._keys:
+                    # only moves up, backdated increments keep their place
+                    timestamp = to_timestamp(datetime.fromisoformat(record["timestamp"]))
+                    key = self._keys[name]
+                    if key[0] == 1 or -key[1] < timestamp:
+                        result.append((name, (0, -timestamp, name)))
+                # rollups keep the newest entries
+        return result
+
+    def update(self, name: str, key: Optional[tuple]) -> None:
+        """
+        Move a task to a new key, as returned by 'updates' or 'refreshed'.
+
+        Args:
+            name (str): Name of the task.
+            key (Optional[tuple]): New key of the task, None to remove it.
+
+        """
+        with self.tracker.lock:
+            self._discard(name)
+            if key is not None:
+                self._keys[name] = key
+                insort(self._order, key)
+
+    def insertion_point(self, key: tuple) -> int:
+        """
+        Get the position a key would be inserted at, before the task at that
+        position.
+
+        Args:
+            key (tuple): Key, as returned by 'updates' or 'refreshed'.
+
+        Returns (int): Position of the key.
+
+        """
+        with self.tracker.lock:
+            return bisect_left(self._order, key)
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def names(self, start: int=0, count: Optional[int]=None) -> List[str]:
+        """
+        Get the names of a page of tasks, most recently active first.
+
+        Args:
+            start (int): Position of the first task of the page.
+            count (Optional[int]): Number of tasks in the page. Defaults to all
+                the remaining tasks.
+
+        Returns (List[str]): Task names.
+
+        """
+        with self.tracker.lock:
+            end = len(self._order) if count is None else start + count
+            return [key[2] for key in self._order[start:end]]
+
+    def name_at(self, position: int) -> str:
+        """
+        Get the name of the task at a position, 0 for the most recently active
+        one.
+
+        Args:
+            position (int): Position of the task.
+
+        Returns (str): Task name.
+
+        """
+        with self.tracker.lock:
+            return self._order[position][2]
+
+    def position(self, name: str) -> Optional[int]:
+        """
+        Get the position of a task in the index.
+
+        Args:
+            name (str): Name of the task.
+
+        Returns (Optional[int]): Position of the task, 0 for the most recently
+            active one, or None if the task is not indexed.
+
+        """
+        with self.tracker.lock:
+            key = self._keys.get(name)
+            if key is None:
+                return None
+            return bisect_left(self._order, key)
+
+    def _discard(self, name: str) -> None:
+        key = self._keys.pop(name, None)
+        if key is not None:
+            del self._order[bisect_left(self._order, key)]
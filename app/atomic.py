@@ -0,0 +1,47 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(file_path: str, mode: str='w'):
+    """
+    Open a temporary file for writing, that replaces 'file_path' only once
+    it is fully written and synced to disk. Readers, or a crash mid-write, can
+    never observe a truncated file.
+
+    Args:
+        file_path (str): Path to the file to replace.
+        mode (str): Open mode of the temporary file ('w' or 'wb'). Defaults
+            to 'w'.
+
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(file_path),
+                                    suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, mode) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+
+        # keep the permissions of the file being replaced
+        if os.path.exists(file_path):
+            os.chmod(tmp_path, os.stat(file_path).st_mode)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # persist the rename itself
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
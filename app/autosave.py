@@ -0,0 +1,158 @@
+import threading
+import time
+import traceback
+from typing import Callable, List, Optional
+
+from .tracker import TaskTracker
+
+
+class AutoSaver:
+    def __init__(self,
+                 tracker: TaskTracker,
+                 save: Callable[[], None],
+                 interval: Optional[float]=2.0,
+                 max_delay: float=30.0,
+                 max_pending: Optional[int]=None):
+        """
+        Save the task tracker in a background thread shortly after it changes.
+        Bursts of changes are coalesced into a single save.
+
+        Args:
+            tracker (TaskTracker): Task tracker to watch for changes.
+            save (Callable[[], None]): Saves the task tracker. Called from the
+                background thread, so it must only read a snapshot of the task
+                tracker (see 'TaskTracker.snapshot').
+            interval (Optional[float]): Seconds without changes after which the
+                tracker is saved, None to only save when asked (see
+                'save_soon') or past 'max_pending'. Defaults to 2 seconds.
+            max_delay (float): Maximum seconds a change can wait to be saved,
+                even if changes keep coming, unless 'interval' is None.
+                Defaults to 30 seconds.
+            max_pending (Optional[int]): Number of unsaved changes after which
+                the tracker is saved right away. Defaults to no limit.
+
+        """
+        self.tracker = tracker
+        self.save = save
+        self.interval = interval
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+
+        # dirty state: number of unsaved changes, and when the first and last
+        # of them happened
+        self.pending = 0
+        self._first_change = None
+        self._last_change = None
+        # whether a save was asked for, changes or not
+        self._requested = False
+
+        self._closed = False
+        self._condition = threading.Condition()
+        self._save_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run,
+                                        name='tracker-autosave',
+                                        daemon=True)
+
+    @property
+    def dirty(self) -> bool:
+        """
+        Whether the task tracker has unsaved changes.
+
+        """
+        return self.pending > 0
+
+    def start(self) -> None:
+        """
+        Start watching the task tracker, and saving it in the background.
+
+        """
+        self.tracker.add_listener(self.mark_dirty)
+        self._thread.start()
+
+    def mark_dirty(self, records: List[dict]=None) -> None:
+        """
+        Mark the task tracker as changed, scheduling a save. Registered as a
+        task tracker listener by 'start'.
+
+        Args:
+            records (List[dict]): Change records. Defaults to a single change.
+
+        """
+        with self._condition:
+            now = time.monotonic()
+            if self.pending == 0:
+                self._first_change = now
+            self._last_change = now
+            self.pending += len(records) if records else 1
+            self._condition.notify()
+
+    def save_soon(self) -> None:
+        """
+        Save the task tracker in the background right away, without waiting
+        for the interval, e.g. once a journal grows past its threshold (see
+        'Journal.on_full').
+
+        """
+        with self._condition:
+            self._requested = True
+            self._condition.notify()
+
+    def flush(self) -> None:
+        """
+        Save the task tracker right away, if it has unsaved changes.
+
+        """
+        with self._condition:
+            if not self.dirty:
+                return
+            self.pending = 0
+        self._save()
+
+    def close(self) -> None:
+        """
+        Stop watching the task tracker, and save any unsaved changes.
+
+        """
+        self.tracker.remove_listener(self.mark_dirty)
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+
+    def _due_in(self) -> Optional[float]:
+        # seconds until the pending changes should be saved, None if not until
+        # asked to
+        if self._requested or (self.max_pending is not None and self.pending >= self.max_pending):
+            return 0.0
+        if not self.dirty or self.interval is None:
+            return None
+        now = time.monotonic()
+        return min(self._last_change + self.interval,
+                   self._first_change + self.max_delay) - now
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closed:
+                    due_in = self._due_in()
+                    if due_in is not None and due_in <= 0:
+                        break
+                    self._condition.wait(due_in)
+                if self._closed:
+                    return
+                self.pending = 0
+                self._requested = False
+
+            # serialize and write outside the condition, so new changes can
+            # still be marked while saving
+            try:
+                self._save()
+            except Exception:
+                # retry with the next changes, or after another interval
+                traceback.print_exc()
+                self.mark_dirty()
+
+    def _save(self) -> None:
+        with self._save_lock:
+            self.save()
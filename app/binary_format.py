@@ -0,0 +1,301 @@
+"""
+Compact binary save format.
+
+Layout (all integers are LEB128 varints, signed ones zigzag encoded):
+
+    magic           b'PTRK' followed by the format version byte
+    task count
+    task table      for each task: name length and UTF-8 name, currency name
+                    length and UTF-8 currency name, currency (signed),
+                    history entry count, history offset (from the start of the
+                    history section), history length in bytes, and last
+                    timestamp (signed, 0 without history)
+    history section for each task: first timestamp (signed), then the deltas
+                    between consecutive timestamps, then the deltas between
+                    consecutive totals (signed, the first one from 0)
+
+Version 1 files, without the last timestamps, are still read.
+
+"""
+import mmap
+from array import array
+from itertools import accumulate
+from typing import List, Optional, Tuple
+
+from .task import HistorySource, Task
+
+MAGIC = b'PTRK'
+VERSION = 2
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+
+def _read_varint(buffer, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _read_varints(data: bytes, count: int) -> Tuple[List[int], int]:
+    # decode 'count' varints from the start of 'data'
+    values = []
+    append = values.append
+    value = 0
+    shift = 0
+    pos = 0
+    for byte in data:
+        pos += 1
+        if byte & 0x80:
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            continue
+        append(value | (byte << shift))
+        value = 0
+        shift = 0
+        if len(values) == count:
+            break
+    if len(values) != count:
+        raise ValueError("Truncated history.")
+    return values, pos
+
+
+def encode_history(timestamps: array, totals: array) -> bytes:
+    """
+    Delta and varint encode a task history.
+
+    Args:
+        timestamps (array): History timestamps, in chronological order.
+        totals (array): History totals.
+
+    Returns (bytes): Encoded history.
+
+    """
+    out = bytearray()
+    if not timestamps:
+        return bytes(out)
+
+    _write_varint(out, _zigzag(timestamps[0]))
+    previous = timestamps[0]
+    for timestamp in timestamps[1:]:
+        _write_varint(out, timestamp - previous)
+        previous = timestamp
+
+    previous = 0
+    for total in totals:
+        _write_varint(out, _zigzag(total - previous))
+        previous = total
+    return bytes(out)
+
+
+def decode_last_timestamp(data: bytes, count: int) -> Optional[int]:
+    """
+    Get the newest timestamp of a task history encoded by 'encode_history',
+    decoding only the timestamps.
+
+    Args:
+        data (bytes): Encoded history.
+        count (int): Number of history entries.
+
+    Returns (Optional[int]): Newest timestamp, or None if the history is empty.
+
+    """
+    if count == 0:
+        return None
+    deltas, _ = _read_varints(data, count)
+    return ((deltas[0] >> 1) ^ -(deltas[0] & 1)) + sum(deltas[1:])
+
+
+def decode_history(data: bytes, count: int) -> Tuple[array, array]:
+    """
+    Decode a task history encoded by 'encode_history'.
+
+    Args:
+        data (bytes): Encoded history.
+        count (int): Number of history entries.
+
+    Returns (Tuple[array, array]): Timestamps and totals.
+
+    """
+    if count == 0:
+        return array('q'), array('q')
+
+    deltas, pos = _read_varints(data, count)
+    deltas[0] = (deltas[0] >> 1) ^ -(deltas[0] & 1)
+    timestamps = array('q', accumulate(deltas))
+
+    deltas, _ = _read_varints(memoryview(data)[pos:], count)
+    totals = array('q', accumulate((delta >> 1) ^ -(delta & 1) for delta in deltas))
+    return timestamps, totals
+
+
+class BinaryHistorySource(HistorySource):
+    __slots__ = ('buffer', 'start', 'end', 'count', 'last')
+
+    def __init__(self, buffer: mmap.mmap, start: int, end: int, count: int,
+                 last: Optional[int]=None):
+        """
+        Task history stored in a memory-mapped binary save file.
+
+        Args:
+            buffer (mmap.mmap): Memory-mapped save file.
+            start (int): Byte offset of the encoded history.
+            end (int): Byte offset right after the encoded history.
+            count (int): Number of history entries.
+            last (Optional[int]): Newest timestamp, if stored in the task
+                table. Defaults to decoding it from the history.
+
+        """
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        self.count = count
+        self.last = last
+
+    def load(self) -> Tuple[array, array]:
+        return decode_history(self.buffer[self.start:self.end], self.count)
+
+    def binary(self) -> Optional[Tuple[bytes, int]]:
+        return self.buffer[self.start:self.end], self.count
+
+    def last_timestamp(self) -> Optional[int]:
+        if self.last is None and self.count:
+            # version 1 file
+            self.last = decode_last_timestamp(self.buffer[self.start:self.end], self.count)
+        return self.last
+
+
+def is_binary(file_path: str) -> bool:
+    """
+    Whether a file is a binary save file.
+
+    Args:
+        file_path (str): Path to the file.
+
+    """
+    with open(file_path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def write_binary(tasks: List[Task], file) -> None:
+    """
+    Write tasks to a binary save file. Histories that are not loaded yet, from
+    another binary save file, are copied over without decoding them.
+
+    Args:
+        tasks (List[Task]): Tasks to write.
+        file: File opened for writing bytes.
+
+    """
+    histories = []
+    for task in tasks:
+        history = task.history_binary()
+        if history is None:
+            timestamps, totals = task.timestamps, task.totals
+            history = encode_history(timestamps, totals), len(timestamps)
+        histories.append(history)
+
+    header = bytearray(MAGIC)
+    header.append(VERSION)
+    _write_varint(header, len(tasks))
+
+    offset = 0
+    for task, (data, count) in zip(tasks, histories):
+        for text in (task.name, task.currency_name):
+            encoded = text.encode('utf-8')
+            _write_varint(header, len(encoded))
+            header += encoded
+        _write_varint(header, _zigzag(task.currency))
+        _write_varint(header, count)
+        _write_varint(header, offset)
+        _write_varint(header, len(data))
+        last = task.last_timestamp if count else None
+        _write_varint(header, _zigzag(last if last is not None else 0))
+        offset += len(data)
+
+    file.write(header)
+    for data, _ in histories:
+        file.write(data)
+
+
+def read_binary(buffer, lazy: bool=False) -> List[Task]:
+    """
+    Read tasks from a binary save file.
+
+    Args:
+        buffer: Save file contents (e.g. a memory-mapped file).
+        lazy (bool): Whether to decode each task history the first time it
+            is needed, instead of right away. Defaults to False.
+
+    Returns (List[Task]): Tasks in the save file.
+
+    Raises:
+        ValueError: If the file is not a binary save file.
+
+    """
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a binary save file.")
+    version = buffer[len(MAGIC)]
+    if version not in (1, VERSION):
+        raise ValueError(f"Unsupported binary save file version {version}.")
+
+    pos = len(MAGIC) + 1
+    task_count, pos = _read_varint(buffer, pos)
+
+    headers = []
+    for _ in range(task_count):
+        texts = []
+        for _ in range(2):
+            length, pos = _read_varint(buffer, pos)
+            texts.append(bytes(buffer[pos:pos + length]).decode('utf-8'))
+            pos += length
+        currency, pos = _read_varint(buffer, pos)
+        count, pos = _read_varint(buffer, pos)
+        offset, pos = _read_varint(buffer, pos)
+        length, pos = _read_varint(buffer, pos)
+        last = None
+        if version > 1:
+            last, pos = _read_varint(buffer, pos)
+            last = (last >> 1) ^ -(last & 1) if count else None
+        headers.append((texts[0], texts[1], (currency >> 1) ^ -(currency & 1),
+                        count, offset, length, last))
+
+    tasks = []
+    for name, currency_name, currency, count, offset, length, last in headers:
+        source = BinaryHistorySource(buffer, pos + offset, pos + offset + length, count, last)
+        task = Task.lazy(name, currency_name, currency, source)
+        if not lazy:
+            task.load_history()
+        tasks.append(task)
+    return tasks
+
+
+def load_binary(file_path: str, lazy: bool=False) -> List[Task]:
+    """
+    Memory-map a binary save file and read its tasks (see 'read_binary').
+
+    Args:
+        file_path (str): Path to the binary save file.
+        lazy (bool): Whether to decode each task history the first time it
+            is needed. Defaults to False.
+
+    Returns (List[Task]): Tasks in the save file.
+
+    """
+    with open(file_path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return read_binary(buffer, lazy)
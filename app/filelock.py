@@ -0,0 +1,77 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks (e.g. on Windows), locking is a no-op
+    fcntl = None
+
+
+def lock_path(file_path: str) -> str:
+    """
+    Path of the lock file guarding 'file_path' (see 'FileLock').
+
+    """
+    return file_path + '.lock'
+
+
+class FileLock:
+    def __init__(self, path: str):
+        """
+        Advisory lock shared by the processes using a file, held on a separate
+        lock file, since save files are replaced rather than written in place.
+        Not reentrant, and threads of a process share the lock: use it from
+        one thread at a time.
+
+        Args:
+            path (str): Path to the lock file (see 'lock_path'). Created if
+                missing.
+
+        """
+        self.path = path
+        self._fd = None
+
+    def acquire(self, exclusive: bool=True) -> None:
+        """
+        Wait for the lock.
+
+        Args:
+            exclusive (bool): Whether to lock out every other process, or only
+                the ones locking exclusively. Defaults to True.
+
+        """
+        if fcntl is None:
+            return
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def release(self) -> None:
+        """
+        Release the lock.
+
+        """
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def locked(self, exclusive: bool=True):
+        """
+        Hold the lock for the duration of a 'with' block (see 'acquire').
+
+        """
+        self.acquire(exclusive)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def close(self) -> None:
+        """
+        Release the lock, and close the lock file.
+
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -1,20 +1,83 @@
-from typing import List, Tuple
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
 from datetime import datetime, timedelta
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.container import BarContainer
+from matplotlib.patches import Patch, Rectangle
 import matplotlib.pyplot as plt
 import mplcursors
 from sparklines import sparklines
 
-from app.task import Task
+from app.task import Task, from_timestamp
+from app.periods import Boundary, DEFAULT_BOUNDARIES, bucket_tasks, period_edges, period_labels
+from app.profiling import timed
+
+
+class _BarRows(BarContainer):
+    # bar container whose bars, one per row, are added and removed in place
+    def __init__(self, patches, graph: 'Graph', period: int, **kwargs):
+        super().__init__(patches, **kwargs)
+        self.graph = graph
+        self.period = period
+
+    def get_children(self):
+        return list(self.patches)
+
+
+@mplcursors.compute_pick.register(_BarRows)
+def _pick_bar(bars: _BarRows, event):
+    # look the hovered bar up by row instead of testing every bar
+    hit = bars.graph.hit_test(event.xdata, event.ydata)
+    if hit is None or hit[1] != bars.period:
+        return None
+    row, period = hit
+    # a fixed target per bar, so moving within it keeps the same selection
+    target = [bars.graph.row_edges[row][period], row]
+    return mplcursors.Selection(bars, target, row, 0, None, None)
+
+
+class GraphUpdate:
+    __slots__ = ('tasks', 'names', 'rows', 'full')
+
+    def __init__(self,
+                 tasks: List[Task],
+                 names: List[str],
+                 rows: Dict[int, List[int]],
+                 full: Optional[datetime]):
+        """
+        Changes to apply to the graph, computed by 'Graph.prepare'.
+
+        Args:
+            tasks (List[Task]): Graphed tasks, one per row.
+            names (List[str]): Task names, one per row.
+            rows (Dict[int, List[int]]): For each row to update, the task
+                totals of each period, oldest first.
+            full (Optional[datetime]): Time all rows were computed at, if
+                they were.
+
+        """
+        self.tasks = tasks
+        self.names = names
+        self.rows = rows
+        self.full = full
 
 
 class Graph:
-    def __init__(self):
+    def __init__(self, periods: Sequence[Boundary]=DEFAULT_BOUNDARIES):
         """
         Create a graph.
 
+        Args:
+            periods (Sequence[Boundary]): Boundaries of the periods the progress
+                is split into, newest first, either relative to now (timedelta)
+                or absolute (datetime). Defaults to the last 3, 6 and 9 months.
+
         """
+        self.periods = periods
+
+        # retention policy of the graphed task histories, if they are rolled up
+        self.retention = None
         # create plot
         self.fig, self.ax = plt.subplots()
 
@@ -34,12 +97,43 @@ class Graph:
             'fc': 'lightblue',
             'boxstyle': 'round,pad=0.3'
         }
-
-        # create mock bars for now, recreated on update
-        self.bars = [self.ax.barh([], [], **self.bar_settings),
-                     self.ax.barh([], [], **self.bar_settings),
-                     self.ax.barh([], [], **self.bar_settings),
-                     self.ax.barh([], [], **self.bar_settings)]
+        self.hover_max_entries = 15
+        self.hover_sparkline_bins = 40
+
+        # task name -> (task, task version, clock tick, tooltip text); relative
+        # times are refreshed on every tick
+        self.hover_refresh_interval = timedelta(minutes=1)
+        self._hover_cache = {}
+
+        # rows are updated in place, recomputing all of them once periods may
+        # have moved past history entries
+        self.full_update_interval = timedelta(minutes=1)
+
+        # one bar container per period, oldest first, with one bar per row;
+        # row i is at y = i
+        labels = list(reversed(period_labels(self.periods)))
+        self.bars = [_BarRows([], self, period, label=label)
+                     for period, label in enumerate(labels)]
+        for bars in self.bars:
+            self.ax.add_container(bars)
+
+        # graphed tasks, the name of the task of each row, and the right edge
+        # of each of its bars (for hit testing)
+        self.tasks = []
+        self.rows = []
+        self.row_edges = []
+        self.last_full_update = None
+
+        # hovered (row, period), if any
+        self.hovered = None
+
+        # when blitting, the bars, legend and tooltips are drawn over a
+        # background captured after each full draw
+        self.blit = False
+        self._background = None
+
+        # created once there are bars to hover
+        self.cursors = None
 
         # connect mplcursors to the figure
         self.fig.canvas.mpl_connect('motion_notify_event', self._on_motion)
@@ -48,10 +142,17 @@ class Graph:
 
     def get_canvas(self):
         """
-        Get a QTAgg Canvas backend of the figure.
+        Get a QTAgg Canvas backend of the figure. Hover highlights are
+        repainted on it with blitting.
 
         """
-        return FigureCanvas(self.fig)
+        canvas = FigureCanvas(self.fig)
+        if canvas.supports_blit:
+            self.blit = True
+            for artist in self._animated_artists():
+                artist.set_animated(True)
+            canvas.mpl_connect('draw_event', self._on_draw)
+        return canvas
 
     def set_color_scheme(self,
                          figure_color: Tuple,
@@ -80,35 +181,108 @@ class Graph:
         self.ax.tick_params(axis='y', colors=text_color)
         self.text_color = text_color
 
-        # bar colors should be different for each of the 4 periods
-        self.bar_color = [bar_color] * 4
-        for i in range(1, 4):
+        # bar colors should be different for each of the periods
+        self.bar_color = [bar_color] * len(self.bars)
+        for i in range(1, len(self.bars)):
             self.bar_color[i] = tuple(min(item + 0.1, 1.0) for item in self.bar_color[i - 1])
 
+        for bars, color in zip(self.bars, self.bar_color):
+            for bar in bars.patches:
+                bar.set_facecolor(color)
+
+        handles = [Patch(facecolor=color, edgecolor=self.bar_settings['edgecolor'],
+                         linewidth=self.bar_settings['linewidth'], label=bars.get_label())
+                   for bars, color in zip(self.bars, self.bar_color)]
+        self.ax.legend(handles=handles, loc='upper right').set_animated(self.blit)
+
+    def hit_test(self, x: Optional[float], y: Optional[float]) -> Optional[Tuple[int, int]]:
+        """
+        Find the bar at data coordinates (x, y).
+
+        Args:
+            x (Optional[float]): X data coordinate.
+            y (Optional[float]): Y data coordinate.
+
+        Returns (Optional[Tuple[int, int]]): Row and period (oldest first) of
+            the bar, or None if there is none.
+
+        """
+        if x is None or y is None or x < 0:
+            return None
+        row = int(y + 0.5) if y > -0.5 else -1
+        if not 0 <= row < len(self.rows) or abs(y - row) > self.bar_settings['height'] / 2:
+            return None
+
+        # first bar ending after x, skipping empty bars
+        edges = self.row_edges[row]
+        period = bisect_right(edges, x)
+        if period == len(edges):
+            return None
+        return row, period
+
+    def _animated_artists(self):
+        for bars in self.bars:
+            yield from bars.patches
+        if self.ax.get_legend() is not None:
+            yield self.ax.get_legend()
+        for cursor in self.cursors or ():
+            for sel in cursor.selections:
+                yield sel.annotation
+
+    @timed()
+    def _on_draw(self, event):
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self._animated_artists():
+            self.fig.draw_artist(artist)
+
+    @timed()
+    def _repaint(self):
+        if not self.blit:
+            return
+        if self._background is None:
+            self.fig.canvas.draw_idle()
+            return
+        canvas = self.fig.canvas
+        canvas.restore_region(self._background)
+        for artist in self._animated_artists():
+            self.fig.draw_artist(artist)
+        canvas.blit(self.fig.bbox)
+
+    def _set_hovered(self, hovered: Optional[Tuple[int, int]]):
+        # only the bars of the hovered period are dimmed, except the hovered
+        # one, so only bars of the old and new hovered periods change
+        previous = self.hovered
+        self.hovered = hovered
+        if previous is not None and hovered is not None and previous[1] == hovered[1]:
+            bars = self.bars[hovered[1]].patches
+            bars[previous[0]].set_alpha(self.hover_alpha_mouse_off)
+            bars[hovered[0]].set_alpha(self.hover_alpha_mouse_on)
+            return
+
+        if previous is not None:
+            for bar in self.bars[previous[1]].patches:
+                bar.set_alpha(self.hover_alpha_mouse_on)
+        if hovered is not None:
+            bars = self.bars[hovered[1]].patches
+            for bar in bars:
+                bar.set_alpha(self.hover_alpha_mouse_off)
+            bars[hovered[0]].set_alpha(self.hover_alpha_mouse_on)
+
     # graph bar hover action
+    @timed()
     def _on_motion(self, event):
         if event.xdata is not None and event.ydata is not None:
-            for i in range(len(self.bars)):
-                # reset alpha for all bars
-                for bar in self.bars[i]:
-                    bar.set_alpha(self.hover_alpha_mouse_off)
-
-                hovering = False
-                # highlight the bar under the cursor (if any)
-                for bar in self.bars[i]:
-                    if bar.contains(event)[0]:
-                        hovering = True
-                        bar.set_alpha(self.hover_alpha_mouse_on)
-                        break
-
-                # reset alpha for all bars, if no bar hovered
-                if hovering is False:
-                    for bar in self.bars[i]:
-                        bar.set_alpha(self.hover_alpha_mouse_on)
-
-    def get_relative_time(self, timestamp):
-        now = datetime.now()
-        delta = now - datetime.fromisoformat(timestamp)
+            hovered = self.hit_test(event.xdata, event.ydata)
+            if hovered != self.hovered:
+                self._set_hovered(hovered)
+                self._repaint()
+
+    def get_relative_time(self, timestamp: Union[str, datetime], now: Optional[datetime]=None):
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        if now is None:
+            now = datetime.now()
+        delta = now - timestamp
 
         # calculate the difference in months, days, hours and minutes
         days = delta.days
@@ -139,7 +313,45 @@ class Graph:
         else:
             return 'just now'
 
+    @timed()
     def get_history_hover(self, task: Task):
+        """
+        Get the tooltip text of a task, cached until the task changes or the
+        clock ticks (see 'hover_refresh_interval').
+
+        Args:
+            task (Task): Task to describe.
+
+        Returns (str): Tooltip text.
+
+        """
+        now = datetime.now()
+        tick = int(now.timestamp() // self.hover_refresh_interval.total_seconds())
+
+        cached = self._hover_cache.get(task.name)
+        if cached is not None and cached[0] is task and cached[1:3] == (task.version, tick):
+            return cached[3]
+
+        text = self._build_history_hover(task, now)
+        self._hover_cache[task.name] = (task, task.version, tick, text)
+        return text
+
+    def _sparkline_values(self, timestamps, totals) -> List[int]:
+        # totals at evenly spaced times over the history, so the sparkline has
+        # a fixed width
+        bins = self.hover_sparkline_bins
+        if len(totals) <= bins:
+            return list(totals)
+        first, last = timestamps[0], timestamps[-1]
+        values = []
+        for i in range(1, bins + 1):
+            edge = first + (last - first) * i // bins
+            values.append(totals[bisect_right(timestamps, edge) - 1])
+        return values
+
+    def _build_history_hover(self, task: Task, now: datetime) -> str:
+        timestamps, totals = task.timestamps, task.totals
+
         # list elemnts, joined at the end
         text = []
 
@@ -147,88 +359,187 @@ class Graph:
         text += [task.name + ' (' + task.currency_name + ')', '']
 
         # add sparkline history
-        text += sparklines([hist['total_currency'] for hist in reversed(task.history)])
+        text += sparklines(self._sparkline_values(timestamps, totals))
 
-        # add relative timestamps
+        # add relative timestamps of the latest entries
         text += ['', 'History:']
-        text += ['(' + str(hist['total_currency']) + ') '
-            + self.get_relative_time(hist['timestamp']) for hist in task.history]
+        shown = min(len(totals), self.hover_max_entries)
+        for i in range(len(totals) - 1, len(totals) - 1 - shown, -1):
+            text.append('(' + str(totals[i]) + ') '
+                        + self.get_relative_time(from_timestamp(timestamps[i]), now))
+
+        hidden = len(totals) - shown
+        if hidden:
+            since = from_timestamp(timestamps[0]).date().isoformat()
+            text.append(f'... and {hidden} older entries since {since}')
 
         return '\n'.join(text)
 
+    @timed()
     def get_months(self, tasks: List[Task]):
-        # split tasks into periods, to plot with different colors
-        current_date = datetime.now()
-
-        three = []
-        six = []
-        nine = []
-        older = []
-        for task in tasks:
-            # calculate the date thresholds
-            three_months_ago = current_date - timedelta(days=90)
-            six_months_ago = current_date - timedelta(days=180)
-            nine_months_ago = current_date - timedelta(days=270)
+        """
+        Split the progress of the tasks into the graph periods.
 
-            # split the list based on date criteria
-            last_three_months = [item for item in task.history if datetime.fromisoformat(item["timestamp"]) >= three_months_ago]
-            last_six_months = [item for item in task.history if six_months_ago <= datetime.fromisoformat(item["timestamp"]) < three_months_ago]
-            last_nine_months = [item for item in task.history if nine_months_ago <= datetime.fromisoformat(item["timestamp"]) < six_months_ago]
-            older_than_nine_months = [item for item in task.history if datetime.fromisoformat(item["timestamp"]) < nine_months_ago]
+        Args:
+            tasks (List[Task]): List of tasks to split.
 
+        Returns: For each period, newest first, the list of task totals at
+            their last increment in the period (0 if none).
 
-            # extract the first item's currency or set it to 0 if the list is empty
-            last_three_months = last_three_months[0]["total_currency"] if last_three_months else 0
-            last_six_months = last_six_months[0]["total_currency"] if last_six_months else 0
-            last_nine_months = last_nine_months[0]["total_currency"] if last_nine_months else 0
-            older_than_nine_months = older_than_nine_months[0]["total_currency"] if older_than_nine_months else 0
+        """
+        now = datetime.now()
+        edges = period_edges(self.periods, now)
+        if self.retention is not None:
+            # split rolled up histories the same as full ones
+            edges = self.retention.snap_edges(edges, now)
+        return bucket_tasks(tasks, edges)
+
+    def stale_rows(self, names: List[str],
+                   changed: Optional[Iterable[str]]=None) -> Tuple[List[int], Optional[datetime]]:
+        """
+        Get the rows 'prepare' recomputes to graph tasks, e.g. to only copy
+        their tasks.
 
-            three.append(last_three_months)
-            six.append(last_six_months)
-            nine.append(last_nine_months)
-            older.append(older_than_nine_months)
+        Args:
+            names (List[str]): Names of the tasks to graph, one per row.
+            changed (Optional[Iterable[str]]): Names of the tasks changed since
+                the last update. Defaults to all rows.
 
-        return three, six, nine, older
+        Returns (Tuple[List[int], Optional[datetime]]): Rows to recompute, and
+            the time all rows are recomputed at, if they are.
 
-    def update_graph(self, tasks: List[Task]):
         """
-        Update the graph details.
+        now = datetime.now()
+        if (changed is None or self.last_full_update is None
+                or now - self.last_full_update >= self.full_update_interval):
+            return list(range(len(names))), now
+
+        # rows showing another task than before, and changed tasks
+        changed = set(changed)
+        return [i for i, name in enumerate(names)
+                if i >= len(self.rows) or name != self.rows[i] or name in changed], None
+
+    @timed()
+    def prepare(self, tasks: List[Task], changed: Optional[Iterable[str]]=None,
+                stale: Optional[Tuple[List[int], Optional[datetime]]]=None) -> GraphUpdate:
+        """
+        Compute the rows to update to graph 'tasks', without touching the
+        figure. Only the tasks of the recomputed rows are read, besides names.
 
         Args:
             tasks (List[Task]): List of tasks to graph.
+            changed (Optional[Iterable[str]]): Names of the tasks changed since
+                the last update. Defaults to updating all rows.
+            stale (Optional[Tuple[List[int], Optional[datetime]]]): Rows to
+                recompute, as returned by 'stale_rows'. Defaults to asking it.
 
-        """
-        # clear ax
-        self.ax.cla()
-
-        # get task names
-        task_names = [task.name for task in tasks]
-        task_months = self.get_months(tasks)
+        Returns (GraphUpdate): Update to apply with 'apply'.
 
-        labels = ["progress older than 9 months",
-                  "progress last 9 months",
-                  "progress last 6 months",
-                  "progress last 3 months"]
+        """
+        names = [task.name for task in tasks]
+        indices, full = stale if stale is not None else self.stale_rows(names, changed)
+
+        columns = self.get_months([tasks[i] for i in indices])
+        rows = {i: list(reversed(row)) for i, row in zip(indices, zip(*columns))}
+        return GraphUpdate(tasks, names, rows, full)
+
+    def _add_row(self):
+        y = len(self.rows)
+        settings = dict(self.bar_settings)
+        height = settings.pop('height')
+        for bars, color in zip(self.bars, self.bar_color):
+            bar = Rectangle((0, y - height / 2), 0, height, facecolor=color,
+                            animated=self.blit, **settings)
+            bar.sticky_edges.x.append(0)
+            self.ax.add_patch(bar)
+            bars.patches.append(bar)
+        self.rows.append(None)
+        self.row_edges.append([0] * len(self.bars))
+
+    def _remove_row(self):
+        for bars in self.bars:
+            bars.patches.pop().remove()
+        self.rows.pop()
+        self.row_edges.pop()
+
+    @timed()
+    def apply(self, update: GraphUpdate):
+        """
+        Apply an update computed by 'prepare' to the figure: bars are updated
+        in place, and rows are added or removed at the end.
 
-        left = [0] * len(task_names)
-        for i, months in enumerate(reversed(task_months)):
-            # create the bars
-            self.bars[i] = self.ax.barh(task_names, months, **self.bar_settings,
-                                        label=labels[i],
-                                        color=self.bar_color[i], left=left)
-            left = [a + b for a, b in zip(left, months)]
+        Args:
+            update (GraphUpdate): Update to apply.
 
+        """
+        names = update.names
+        renamed = names != self.rows
+        self._set_hovered(None)
+        while len(self.rows) > len(names):
+            self._remove_row()
+        while len(self.rows) < len(names):
+            self._add_row()
+
+        for i, row in update.rows.items():
+            left = 0
+            edges = self.row_edges[i]
+            for period, (bars, width) in enumerate(zip(self.bars, row)):
+                bar = bars.patches[i]
+                bar.set_x(left)
+                bar.set_width(width)
+                bar.sticky_edges.x[:] = [left]
+                left += width
+                edges[period] = left
+
+        if renamed:
+            self.ax.set_yticks(range(len(names)), names)
+            self.rows = list(names)
+            # forget the tooltips of removed tasks
+            graphed = set(names)
+            self._hover_cache = {name: cached for name, cached in self._hover_cache.items()
+                                 if name in graphed}
+        self.tasks = update.tasks
+        if update.full is not None:
+            self.last_full_update = update.full
+
+        # same limits as autoscaling the bars
+        height = self.bar_settings['height']
+        right = max((edges[-1] for edges in self.row_edges), default=0) or 1
+        low, high = -height / 2, max(len(names) - 1, 0) + height / 2
+        margin = self.ax.margins()
+        self.ax.set_xlim(0, right * (1 + margin[0]))
+        self.ax.set_ylim(low - (high - low) * margin[1], high + (high - low) * margin[1])
+
+        if self.cursors is None and self.rows:
+            self._connect_cursors()
+
+    def _connect_cursors(self):
+        self.cursors = []
+        for bars in self.bars:
             # add interactive cursor for the bars
-            cursor = mplcursors.cursor(self.bars[i],
-                                       hover=mplcursors.HoverMode.Transient)
+            cursor = mplcursors.cursor(bars, hover=mplcursors.HoverMode.Transient)
 
             # display task history on hover
             def on_add(sel):
                 index = sel.index
                 sel.annotation.get_bbox_patch().set(**self.hover_settings)
-                sel.annotation.set_text(self.get_history_hover(tasks[index]))
+                # drawn over the blitted bars
+                sel.annotation.set_animated(self.blit)
+                sel.annotation.set_text(self.get_history_hover(self.tasks[index]))
 
             # connect hover tooltip
             cursor.connect('add', on_add)
+            self.cursors.append(cursor)
 
-        self.ax.legend(loc='upper right')
+    @timed()
+    def update_graph(self, tasks: List[Task], changed: Optional[Iterable[str]]=None):
+        """
+        Update the graph details.
+
+        Args:
+            tasks (List[Task]): List of tasks to graph.
+            changed (Optional[Iterable[str]]): Names of the tasks changed since
+                the last update, the only rows recomputed. Defaults to all.
+
+        """
+        self.apply(self.prepare(tasks, changed))
@@ -0,0 +1,366 @@
+"""
+Localhost HTTP endpoint ingesting progress events into a task tracker.
+
+    POST /events    a JSON event, a list of events, or {"events": [...]}, each
+                    event being {"task": name, "step": 1, "timestamp": ISO
+                    format time or null}. Replies 202 once the events are
+                    queued, or, with '?wait=1', 200 once they are applied. The
+                    request waits while the queue is full, and gets a 503 if it
+                    stays full.
+    GET /stats      counters and queue size.
+
+Events are applied to the tracker in batches (see 'TaskTracker.apply_batch'),
+so each batch costs one journal write or database transaction.
+
+"""
+import asyncio
+import json
+import threading
+from datetime import datetime
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from .tracker import TaskTracker
+
+_REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+            405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error',
+            503: 'Service Unavailable'}
+
+# largest accepted request body
+MAX_BODY = 16 * 2**20
+
+
+class _HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_events(body: bytes) -> List[tuple]:
+    """
+    Parse the events of a POST /events body.
+
+    Returns (List[tuple]): Increments, as for 'TaskTracker.apply_batch'.
+
+    Raises:
+        ValueError: If the body or an event is malformed.
+
+    """
+    events = json.loads(body)
+    if isinstance(events, dict):
+        events = events.get("events", [events])
+    if not isinstance(events, list):
+        raise ValueError("Expected an event, a list of events, or {\"events\": [...]}.")
+
+    ops = []
+    for i, event in enumerate(events):
+        if not isinstance(event, dict) or not isinstance(event.get("task"), str):
+            raise ValueError(f"Event {i}: expected {{\"task\": name, ...}}.")
+        step = event.get("step", 1)
+        if not isinstance(step, int) or isinstance(step, bool) or step < 1:
+            raise ValueError(f"Event {i}: step must be a positive integer.")
+        timestamp = event.get("timestamp")
+        if timestamp is not None:
+            if not isinstance(timestamp, str):
+                raise ValueError(f"Event {i}: timestamp must be an ISO format string or null.")
+            try:
+                timestamp = datetime.fromisoformat(timestamp)
+            except ValueError as error:
+                raise ValueError(f"Event {i}: {error}") from None
+        ops.append(("increment", event["task"], step, timestamp))
+    return ops
+
+
+class IngestServer:
+    def __init__(self,
+                 tracker: TaskTracker,
+                 host: str='127.0.0.1',
+                 port: int=8765,
+                 max_queue: int=100000,
+                 max_batch: int=5000,
+                 max_delay: float=0.05,
+                 queue_timeout: float=5.0):
+        """
+        HTTP endpoint queueing progress events, and applying them to a task
+        tracker in batches of at most 'max_batch' events, at most 'max_delay'
+        seconds after the first event of the batch was queued.
+
+        Args:
+            tracker (TaskTracker): Task tracker to apply the events to.
+            host (str): Address to bind. Defaults to localhost only.
+            port (int): Port to bind, 0 for any. Defaults to 8765.
+            max_queue (int): Events queued before requests wait. Defaults to
+                100000.
+            max_batch (int): Events applied at once. Defaults to 5000.
+            max_delay (float): Seconds a batch waits for more events. Defaults
+                to 0.05.
+            queue_timeout (float): Seconds a request waits for room in the
+                queue before failing. Defaults to 5.
+
+        """
+        self.tracker = tracker
+        self.host = host
+        self.port = port
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue_timeout = queue_timeout
+
+        self.received = 0
+        self.applied = 0
+        self.rejected = 0
+        self.batches = 0
+
+        self._queue = None
+        self._server = None
+        self._flusher = None
+        self._writers = set()
+        self._loop = None
+        self._thread = None
+
+    async def start(self) -> None:
+        """
+        Start listening and flushing. 'port' is set to the bound port.
+
+        """
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.max_queue)
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        """
+        Stop listening, and apply the events still queued.
+
+        """
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+
+        # the flusher stops after applying everything queued before this
+        await self._queue.put(None)
+        await self._flusher
+
+    async def serve(self) -> None:
+        """
+        Run until cancelled, e.g. by 'asyncio.run' on KeyboardInterrupt.
+
+        """
+        await self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.close()
+
+    def start_thread(self) -> None:
+        """
+        Run the endpoint on its own event loop in a background thread, e.g.
+        next to the Qt event loop. Returns once it is listening.
+
+        Raises:
+            OSError: If the endpoint can't listen (e.g. the port is in use).
+
+        """
+        started = threading.Event()
+        errors = []
+
+        def run():
+            async def main():
+                await self.start()
+                started.set()
+                await self._flusher
+
+            try:
+                asyncio.run(main())
+            except Exception as error:
+                errors.append(error)
+            finally:
+                started.set()
+
+        self._thread = threading.Thread(target=run, name='ingest', daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            self._thread = None
+            raise errors[0]
+
+    def stop_thread(self) -> None:
+        """
+        Stop the endpoint started by 'start_thread', applying the events still
+        queued.
+
+        """
+        if self._thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.close(), self._loop).result()
+        self._thread.join()
+        self._thread = None
+
+    def stats(self) -> dict:
+        """
+        Counters of received, applied and rejected events, applied batches,
+        and the current queue size.
+
+        """
+        return {"received": self.received, "applied": self.applied,
+                "rejected": self.rejected, "batches": self.batches,
+                "queued": self._queue.qsize() if self._queue is not None else 0}
+
+    async def _flush_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopped = False
+        while not stopped:
+            # None is queued by 'close'
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                if item is None:
+                    stopped = True
+                    break
+                batch.append(item)
+
+            # the tracker and its storage block, keep serving meanwhile
+            try:
+                applied = await loop.run_in_executor(None, self._apply, [op for op, _ in batch])
+                error = None
+            except Exception as exception:
+                applied, error = 0, exception
+            for _, done in batch:
+                if done is not None and not done.done():
+                    if error is None:
+                        done.set_result(applied)
+                    else:
+                        done.set_exception(error)
+
+    def _apply(self, ops: List[tuple]) -> int:
+        with self.tracker.lock:
+            # tasks can be removed while their events are queued
+            valid = [op for op in ops if self.tracker.get_task(op[1]) is not None]
+            self.tracker.apply_batch(valid)
+        self.rejected += len(ops) - len(valid)
+        self.applied += len(valid)
+        self.batches += 1
+        return len(valid)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, body, keep_alive = request
+                try:
+                    status, reply = await self._route(method, target, body)
+                except _HttpError as error:
+                    status, reply = error.status, {"error": str(error)}
+                except Exception as error:
+                    # e.g. the batch of a waiting request failed to apply
+                    status, reply = 500, {"error": str(error)}
+                await self._write_response(writer, status, reply, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except _HttpError as error:
+            # malformed request framing, the connection can't be reused
+            await self._write_response(writer, error.status, {"error": str(error)}, False)
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, bytes, bool]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode('latin-1').split()
+        except ValueError:
+            raise _HttpError(400, "Malformed request line.") from None
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0) or 0)
+        except ValueError:
+            raise _HttpError(400, "Malformed Content-Length.") from None
+        if length < 0:
+            raise _HttpError(400, "Malformed Content-Length.")
+        if length > MAX_BODY:
+            raise _HttpError(413, "Request body too large.")
+        body = await reader.readexactly(length) if length else b''
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        return method, target, body, keep_alive
+
+    async def _route(self, method: str, target: str, body: bytes) -> Tuple[int, dict]:
+        url = urlsplit(target)
+        if url.path == '/stats':
+            if method != 'GET':
+                raise _HttpError(405, "Use GET.")
+            return 200, self.stats()
+        if url.path != '/events':
+            raise _HttpError(404, f"No such endpoint \"{url.path}\".")
+        if method != 'POST':
+            raise _HttpError(405, "Use POST.")
+
+        try:
+            ops = parse_events(body)
+        except ValueError as error:
+            raise _HttpError(400, str(error)) from None
+        missing = sorted({op[1] for op in ops if self.tracker.get_task(op[1]) is None})
+        if missing:
+            raise _HttpError(404, "No such tasks: " + ', '.join(f'"{name}"' for name in missing))
+        self.received += len(ops)
+
+        wait = parse_qs(url.query).get('wait', ['0'])[0] not in ('0', '')
+        done = self._loop.create_future() if wait and ops else None
+        try:
+            for i, op in enumerate(ops):
+                # the last event resolves once its batch is applied
+                item = (op, done if i == len(ops) - 1 else None)
+                if self._queue.full():
+                    await asyncio.wait_for(self._queue.put(item), self.queue_timeout)
+                else:
+                    self._queue.put_nowait(item)
+        except asyncio.TimeoutError:
+            raise _HttpError(503, f"Queue full, {i} of {len(ops)} events queued.") from None
+
+        if done is None:
+            return 202, {"queued": len(ops)}
+        await done
+        return 200, {"applied": len(ops)}
+
+    async def _write_response(self, writer: asyncio.StreamWriter, status: int,
+                              reply: dict, keep_alive: bool) -> None:
+        body = json.dumps(reply).encode()
+        head = (f'HTTP/1.1 {status} {_REASONS.get(status, "")}\r\n'
+                f'Content-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: {"keep-alive" if keep_alive else "close"}\r\n')
+        if status == 503:
+            head += 'Retry-After: 1\r\n'
+        writer.write(head.encode('latin-1') + b'\r\n' + body)
+        await writer.drain()
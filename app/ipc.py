@@ -0,0 +1,146 @@
+"""
+Requests to a running tracker instance, sent as JSON lines over a Unix domain
+socket. Each request is a dict with a "command" key:
+
+    {"command": "batch", "ops": [...]}          mutations, as for
+                                                'TaskTracker.apply_batch', with
+                                                ISO format timestamps
+    {"command": "list"}                         list the tasks
+    {"command": "export", "path": ..., "format": ...}
+    {"command": "show"}                         show the GUI window
+
+and gets a single reply line, {"ok": true, ...} or {"ok": false, "error": ...}.
+
+"""
+import hashlib
+import json
+import os
+import socket
+import tempfile
+from datetime import datetime
+from typing import Optional
+
+from .tracker import TaskTracker, detect_format
+
+
+class RequestError(Exception):
+    """
+    A request was sent to a running instance, but got no valid reply (e.g. the
+    instance is busy past the timeout, or closed the connection). The request
+    may or may not have run.
+
+    """
+
+
+def socket_path(save_file: str) -> str:
+    """
+    Path of the socket of the instance running on a save file.
+
+    Args:
+        save_file (str): Path to the tracker save file.
+
+    """
+    runtime_dir = os.getenv('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    digest = hashlib.sha1(os.path.abspath(save_file).encode()).hexdigest()[:16]
+    return os.path.join(runtime_dir, f'progress-tracker-{digest}.sock')
+
+
+def encode_op(op: tuple) -> list:
+    """
+    Encode a mutation (see 'TaskTracker.apply_batch') as JSON.
+
+    """
+    if op[0] == "increment" and len(op) == 4 and op[3] is not None:
+        return [*op[:3], op[3].isoformat()]
+    return list(op)
+
+
+def decode_op(op: list) -> tuple:
+    """
+    Decode a mutation encoded by 'encode_op'.
+
+    Raises:
+        ValueError: If the mutation is malformed.
+
+    """
+    # an operation and a task name, at least
+    if not isinstance(op, list) or len(op) < 2 or not isinstance(op[0], str):
+        raise ValueError(f"Malformed mutation {op!r}.")
+    if op[0] == "increment" and len(op) == 4 and op[3] is not None:
+        return (*op[:3], datetime.fromisoformat(op[3]))
+    return tuple(op)
+
+
+def handle_request(tracker: TaskTracker, request: dict) -> dict:
+    """
+    Run a request on a task tracker. "show" requests are left to the GUI.
+
+    Args:
+        tracker (TaskTracker): Task tracker to run the request on.
+        request (dict): Request to run.
+
+    Returns (dict): Reply to the request.
+
+    """
+    command = request.get("command")
+    try:
+        if command == "batch":
+            tracker.apply_batch([decode_op(op) for op in request["ops"]])
+            return {"ok": True}
+        if command == "list":
+            with tracker.lock:
+                tasks = [[task.name, task.currency, task.currency_name]
+                         for task in tracker.tasks]
+            return {"ok": True, "tasks": tasks}
+        if command == "export":
+            path = request["path"]
+            tracker.export_to_file(path, request.get("format") or detect_format(path))
+            return {"ok": True}
+    except (KeyError, TypeError, ValueError, OSError) as error:
+        return {"ok": False, "error": str(error)}
+    return {"ok": False, "error": f"Unknown command \"{command}\"."}
+
+
+def send_request(path: str, request: dict, timeout: float=5.0) -> Optional[dict]:
+    """
+    Send a request to the instance listening on 'path'.
+
+    Args:
+        path (str): Socket path (see 'socket_path').
+        request (dict): Request to send.
+        timeout (float): Seconds to wait for the reply. Defaults to 5.
+
+    Returns (Optional[dict]): Reply, or None if no instance is listening.
+
+    Raises:
+        RequestError: If the instance listening doesn't reply in time, or
+            replies something else than a JSON object.
+
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        try:
+            client.connect(path)
+        except OSError:
+            # no socket, or a stale one left by an instance that crashed
+            return None
+
+        try:
+            client.sendall(json.dumps(request).encode() + b'\n')
+            reply = b''
+            while not reply.endswith(b'\n'):
+                chunk = client.recv(65536)
+                if not chunk:
+                    raise RequestError("Tracker instance closed the connection.")
+                reply += chunk
+            reply = json.loads(reply)
+        except socket.timeout:
+            raise RequestError(f"No reply from the tracker instance within {timeout:g}s.") from None
+        except (OSError, ValueError) as error:
+            raise RequestError(f"Failed talking to the tracker instance: {error}") from None
+    if not isinstance(reply, dict):
+        raise RequestError("Malformed reply from the tracker instance.")
+    return reply
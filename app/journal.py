@@ -0,0 +1,372 @@
+import json
+import os
+import threading
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from .atomic import atomic_write
+from .filelock import FileLock, lock_path
+from .profiling import timed
+from .tracker import TaskTracker
+
+
+class Journal:
+    def __init__(self,
+                 tracker: TaskTracker,
+                 save_file: str,
+                 journal_file: str=None,
+                 compact_threshold: int=1000,
+                 fsync: bool=False,
+                 save_format: str='json'):
+        """
+        Create an append-only journal of task tracker changes, stored as JSON
+        lines next to the tracker save file.
+
+        Several processes can journal to the same save file: appends and
+        compactions are serialized by an advisory lock on the save file (see
+        'app.filelock'), and compactions merge the changes of the other
+        processes (see 'TaskTracker.merge') instead of overwriting them.
+
+        Args:
+            tracker (TaskTracker): Task tracker to journal.
+            save_file (str): Path to the tracker snapshot file.
+            journal_file (str): Path to the journal file. Defaults to the save
+                file path, with a '.journal' suffix.
+            compact_threshold (int): Number of journaled records after which
+                the journal is folded into a new snapshot. Defaults to 1000.
+            fsync (bool): Whether to fsync the journal after every write.
+                Defaults to False.
+            save_format (str): Format of the snapshots (see
+                'TaskTracker.export_to_file'). Defaults to 'json'.
+
+        """
+        self.tracker = tracker
+        self.save_file = save_file
+        self.journal_file = journal_file or save_file + '.journal'
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+        self.save_format = save_format
+
+        # number of records currently in the journal file
+        self.size = 0
+        self._file = None
+
+        # records are journaled with a unique id: the origin of this journal,
+        # and a sequence number
+        self._origin = uuid.uuid4().hex
+        self._sequence = 0
+
+        # last records folded into the save file, by origin, written before
+        # the save file is replaced (see 'compact')
+        self.folded_file = self.journal_file + '.folded'
+
+        # held while folding the journal into a snapshot
+        self._compact_lock = threading.Lock()
+
+        # shared by appends, exclusive for compactions, across processes
+        self.lock = FileLock(lock_path(save_file))
+        # whether a compaction of this process holds the lock exclusively
+        self._compacting = False
+
+        # task tracker as last loaded from or saved to the save file, names of
+        # the tasks changed since, and the save file and journal as they
+        # should be on disk unless another process changed them
+        self._base = None
+        self._changed = set()
+        self._disk_state = None
+
+        # called with the names of the tasks changed by merging the changes of
+        # other processes, from the thread compacting
+        self.on_merge: Optional[Callable[[List[str]], None]] = None
+
+        # called from the appending thread once the journal grows past the
+        # compaction threshold, to compact it on another thread (e.g.
+        # 'AutoSaver.save_soon'); compacts right away if unset
+        self.on_full: Optional[Callable[[], None]] = None
+
+    def replay(self) -> int:
+        """
+        Replay the journal on top of the task tracker. Records already folded
+        into the save file (e.g. after a crash while compacting) are skipped,
+        and a partially written last record (e.g. after a crash) is ignored.
+
+        Returns (int): Number of records in the journal.
+
+        """
+        self.size = 0
+        if not os.path.exists(self.journal_file):
+            return self.size
+
+        records = []
+        with open(self.journal_file, 'r') as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+
+        folded = self._folded()
+        seen = set()
+        for record in records:
+            record_id = record.pop("id", None)
+            if record_id is not None:
+                origin, sequence = _parse_id(record_id)
+                if record_id in seen or sequence <= folded.get(origin, 0):
+                    continue
+                seen.add(record_id)
+            self.tracker.apply_record(record)
+        self.size = len(records)
+        return self.size
+
+    def attach(self) -> None:
+        """
+        Start journaling the task tracker changes. The task tracker is
+        expected to be loaded from the save file, with the journal replayed.
+
+        """
+        self._file = open(self.journal_file, 'ab')
+        with self.tracker.lock:
+            self._sync(self.tracker.snapshot())
+            self.tracker.add_listener(self.append)
+
+    def detach(self) -> None:
+        """
+        Stop journaling the task tracker changes.
+
+        """
+        self.tracker.remove_listener(self.append)
+        self._file.close()
+        self._file = None
+        self.lock.close()
+
+    def append(self, records: List[dict]) -> None:
+        """
+        Append change records to the journal. Compacts the journal once it
+        grows past the compaction threshold, or has 'on_full' compact it.
+
+        Args:
+            records (List[dict]): Change records to append.
+
+        """
+        with self.tracker.lock:
+            lines = []
+            for record in records:
+                self._sequence += 1
+                lines.append(json.dumps(dict(record, id=f'{self._origin}:{self._sequence}')) + '\n')
+            data = ''.join(lines).encode()
+
+            for record in records:
+                self._changed.add(record["task"]["name"] if record["op"] == "add" else record["name"])
+
+            # a compaction of this process already holds the lock
+            if not self._compacting:
+                self.lock.acquire(exclusive=False)
+            try:
+                self._reopen_if_replaced()
+                self._file.write(data)
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            finally:
+                if not self._compacting:
+                    self.lock.release()
+            self.size += len(records)
+            self._disk_state = (self._disk_state[0], self._disk_state[1] + len(data))
+
+        if self.size >= self.compact_threshold:
+            if self.on_full is not None:
+                self.on_full()
+            else:
+                # don't wait on a compaction already running in another thread
+                self.compact(blocking=False)
+
+    @timed()
+    def compact(self, blocking: bool=True) -> bool:
+        """
+        Fold the journal into a new snapshot of the task tracker, and truncate
+        the journal. Changes saved by other processes since the task tracker was
+        loaded or last saved are merged first, then task histories are rolled
+        up, per the task tracker retention policy. Safe to call from another
+        thread than the one changing the task tracker; records journaled while
+        the snapshot is written are kept.
+
+        Args:
+            blocking (bool): Whether to wait for a compaction already running
+                in another thread. Defaults to True.
+
+        Returns (bool): Whether the journal was compacted.
+
+        """
+        if not self._compact_lock.acquire(blocking):
+            return False
+        try:
+            # appends of this process skip the lock while it is held here
+            with self.tracker.lock:
+                self.lock.acquire()
+                self._compacting = True
+            try:
+                merged = self._merge_disk_changes()
+
+                with self.tracker.lock:
+                    self.tracker.compact_history()
+                    snapshot = self.tracker.snapshot()
+                    offset = self._journal_end()
+                    size = self.size
+                    changed, self._changed = self._changed, set()
+
+                # replace the snapshot first, recording the records folded into
+                # it, which a stale journal replays on top of it without
+                try:
+                    self._write_folded(offset)
+                    snapshot.export_to_file(self.save_file, self.save_format)
+                except BaseException:
+                    with self.tracker.lock:
+                        self._changed |= changed
+                    raise
+
+                with self.tracker.lock:
+                    self._drop_journal_head(offset)
+                    # the folded records are gone from the journal
+                    if os.path.exists(self.folded_file):
+                        os.remove(self.folded_file)
+                    self.size -= size
+                    self._sync(snapshot)
+            finally:
+                with self.tracker.lock:
+                    self._compacting = False
+                    self.lock.release()
+        finally:
+            self._compact_lock.release()
+
+        if merged and self.on_merge is not None:
+            self.on_merge(merged)
+        return True
+
+    def _disk_files(self) -> tuple:
+        # identity of the save file contents, and size of the journal
+        try:
+            stat = os.stat(self.save_file)
+            snapshot = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            snapshot = None
+        try:
+            journal = os.path.getsize(self.journal_file)
+        except FileNotFoundError:
+            journal = 0
+        return snapshot, journal
+
+    def _sync(self, base: TaskTracker) -> None:
+        # the save file and journal now hold 'base', and the changes since
+        self._base = base
+        self._disk_state = self._disk_files()
+
+    def _merge_disk_changes(self) -> List[str]:
+        # unchanged by other processes, nothing to merge
+        if self._disk_state is not None and self._disk_files() == self._disk_state:
+            return []
+
+        if os.path.exists(self.save_file):
+            theirs = TaskTracker.import_from_file(self.save_file, lazy=True)
+        else:
+            theirs = TaskTracker()
+        Journal(theirs, self.save_file, self.journal_file).replay()
+
+        with self.tracker.lock:
+            return self.tracker.merge(theirs, self._base, self._changed)
+
+    def _folded(self) -> Dict[str, int]:
+        # last records folded into the save file, by origin, from the
+        # compactions that replaced the save file since
+        try:
+            with open(self.folded_file, 'r') as file:
+                entries = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return {}
+        current = self._disk_files()[0]
+        current = list(current) if current is not None else None
+
+        folded = {}
+        for entry in entries:
+            if entry["replaced"] != current:
+                for origin, sequence in entry["records"].items():
+                    folded[origin] = max(folded.get(origin, 0), sequence)
+        return folded
+
+    def _write_folded(self, offset: int) -> None:
+        # last record of each origin up to 'offset' in the journal, and the
+        # save file they are folded into the replacement of; entries left by
+        # a crash that are still needed are kept
+        records = {}
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'rb') as file:
+                for line in file.read(offset).splitlines():
+                    try:
+                        record_id = json.loads(line).get("id")
+                    except ValueError:
+                        continue
+                    if record_id is not None:
+                        origin, sequence = _parse_id(record_id)
+                        records[origin] = max(records.get(origin, 0), sequence)
+
+        current = self._disk_files()[0]
+        current = list(current) if current is not None else None
+        try:
+            with open(self.folded_file, 'r') as file:
+                entries = [entry for entry in json.load(file) if entry["replaced"] != current]
+        except (FileNotFoundError, ValueError):
+            entries = []
+        entries.append({"replaced": current, "records": records})
+        with atomic_write(self.folded_file) as file:
+            json.dump(entries, file)
+
+    def _reopen_if_replaced(self) -> None:
+        # another process compacted the journal, append to the new one
+        try:
+            replaced = os.stat(self.journal_file).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            replaced = True
+        if replaced:
+            self._file.close()
+            self._file = open(self.journal_file, 'ab')
+
+    def _journal_end(self) -> int:
+        if self._file is not None:
+            # the end of the journal another process replaced it with, and
+            # past their appends, not only ours
+            self._reopen_if_replaced()
+            self._file.flush()
+            return os.fstat(self._file.fileno()).st_size
+        if os.path.exists(self.journal_file):
+            return os.path.getsize(self.journal_file)
+        return 0
+
+    def _drop_journal_head(self, offset: int) -> None:
+        if not os.path.exists(self.journal_file):
+            return
+
+        # keep the records appended after 'offset'
+        with open(self.journal_file, 'rb') as file:
+            file.seek(offset)
+            tail = file.read()
+        with atomic_write(self.journal_file, 'wb') as file:
+            file.write(tail)
+
+        if self._file is not None:
+            self._file.close()
+            self._file = open(self.journal_file, 'ab')
+
+    def close(self) -> None:
+        """
+        Compact the journal, if it has any records, and stop journaling.
+
+        """
+        if self.size:
+            self.compact()
+        if self._file is not None:
+            self.detach()
+
+
+def _parse_id(record_id: str) -> tuple:
+    # origin and sequence number of a journaled record
+    origin, sequence = record_id.rsplit(':', 1)
+    return origin, int(sequence)
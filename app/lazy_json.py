@@ -0,0 +1,157 @@
+import json
+import mmap
+import re
+from array import array
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from .task import HistorySource, Task, parse_history, to_timestamp
+
+_WHITESPACE = re.compile(rb'[ \t\n\r]*')
+_STRING = re.compile(rb'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_SCALAR = re.compile(rb'-?[0-9]+(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?|true|false|null')
+
+
+class JsonHistorySource(HistorySource):
+    __slots__ = ('buffer', 'start', 'end')
+
+    def __init__(self, buffer: mmap.mmap, start: int, end: int):
+        """
+        Task history stored as a JSON array in a memory-mapped save file.
+
+        Args:
+            buffer (mmap.mmap): Memory-mapped save file.
+            start (int): Byte offset of the history array.
+            end (int): Byte offset right after the history array.
+
+        """
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+
+    def load(self) -> Tuple[array, array]:
+        return parse_history(json.loads(self.buffer[self.start:self.end]))
+
+    def json_text(self) -> Optional[str]:
+        return self.buffer[self.start:self.end].decode('utf-8')
+
+    def last_timestamp(self) -> Optional[int]:
+        # histories are saved newest first, read the first entry only
+        end = self.buffer.find(b'}', self.start, self.end)
+        key = self.buffer.find(b'"timestamp"', self.start, end) if end >= 0 else -1
+        if key < 0:
+            return None
+        pos = _skip_whitespace(self.buffer, _expect(self.buffer, key + len(b'"timestamp"'), b':'))
+        value, _ = _read_string(self.buffer, pos)
+        return to_timestamp(datetime.fromisoformat(value))
+
+
+def _skip_whitespace(buffer, pos: int) -> int:
+    return _WHITESPACE.match(buffer, pos).end()
+
+
+def _expect(buffer, pos: int, char: bytes) -> int:
+    pos = _skip_whitespace(buffer, pos)
+    if buffer[pos:pos + 1] != char:
+        raise ValueError(f"Expected {char!r} at byte {pos}.")
+    return pos + 1
+
+
+def _read_string(buffer, pos: int) -> Tuple[str, int]:
+    match = _STRING.match(buffer, pos)
+    if match is None:
+        raise ValueError(f"Expected string at byte {pos}.")
+    return json.loads(match.group()), match.end()
+
+
+def _read_scalar(buffer, pos: int):
+    if buffer[pos:pos + 1] == b'"':
+        return _read_string(buffer, pos)
+    match = _SCALAR.match(buffer, pos)
+    if match is None:
+        raise ValueError(f"Unexpected value at byte {pos}.")
+    return json.loads(match.group()), match.end()
+
+
+def _skip_history(buffer, pos: int) -> int:
+    # history entries are flat objects of numbers and timestamps, so the array
+    # ends at the first closing bracket
+    end = buffer.find(b']', pos)
+    if end < 0 or buffer.find(b'[', pos + 1, end) >= 0:
+        raise ValueError(f"Unexpected history at byte {pos}.")
+    return end + 1
+
+
+def scan_tasks(buffer) -> List[Task]:
+    """
+    Scan a JSON save file for the task headers (name, currency name and
+    currency), skipping over the task histories. Each history is loaded from
+    the buffer the first time it is needed.
+
+    Args:
+        buffer: Save file contents (e.g. a memory-mapped file).
+
+    Returns (List[Task]): Tasks whose histories are not loaded yet.
+
+    Raises:
+        ValueError: If the file is not laid out as a save file.
+
+    """
+    tasks = []
+
+    pos = _expect(buffer, 0, b'[')
+    pos = _skip_whitespace(buffer, pos)
+    if buffer[pos:pos + 1] == b']':
+        return tasks
+
+    while True:
+        pos = _expect(buffer, pos, b'{')
+        header = {}
+        history = None
+        while True:
+            pos = _skip_whitespace(buffer, pos)
+            key, pos = _read_string(buffer, pos)
+            pos = _skip_whitespace(buffer, _expect(buffer, pos, b':'))
+            if key == 'history':
+                if buffer[pos:pos + 1] != b'[':
+                    raise ValueError(f"Expected history array at byte {pos}.")
+                end = _skip_history(buffer, pos)
+                history = (pos, end)
+                pos = end
+            else:
+                header[key], pos = _read_scalar(buffer, pos)
+
+            pos = _skip_whitespace(buffer, pos)
+            if buffer[pos:pos + 1] == b'}':
+                pos += 1
+                break
+            pos = _expect(buffer, pos, b',')
+
+        if history is None:
+            raise ValueError("Task without history.")
+        task = Task.lazy(header["name"], header["currency_name"], header["currency"],
+                         JsonHistorySource(buffer, *history))
+        tasks.append(task)
+
+        pos = _skip_whitespace(buffer, pos)
+        if buffer[pos:pos + 1] == b']':
+            return tasks
+        pos = _expect(buffer, pos, b',')
+
+
+def load_lazy(json_file_path: str) -> List[Task]:
+    """
+    Memory-map a JSON save file and scan it for tasks (see 'scan_tasks').
+
+    Args:
+        json_file_path (str): Path to JSON file.
+
+    Returns (List[Task]): Tasks whose histories are not loaded yet.
+
+    Raises:
+        ValueError: If the file is empty or not laid out as a save file.
+
+    """
+    with open(json_file_path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return scan_tasks(buffer)
@@ -0,0 +1,99 @@
+from array import array
+from typing import Dict, Optional, Tuple
+
+from .task import Task
+
+
+def common_prefix(timestamps: array, totals: array,
+                  other_timestamps: array, other_totals: array) -> int:
+    """
+    Number of leading entries two task histories have in common.
+
+    """
+    def same(n: int) -> bool:
+        return timestamps[:n] == other_timestamps[:n] and totals[:n] == other_totals[:n]
+
+    # histories usually only differ by their newest entries
+    n = min(len(timestamps), len(other_timestamps))
+    if same(n):
+        return n
+
+    # 'low' entries are in common, 'high' entries are not
+    low, high = 0, n
+    while high - low > 1:
+        middle = (low + high) // 2
+        if same(middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def history_steps(timestamps: array, totals: array, start: int=0) -> Dict[Tuple[int, int], int]:
+    """
+    Steps of the history entries from 'start' on, keyed by timestamp and by
+    occurrence of the timestamp, for entries sharing a timestamp.
+
+    """
+    steps = {}
+    previous = totals[start - 1] if start else 0
+    occurrence = 0
+    for i in range(start, len(timestamps)):
+        occurrence = occurrence + 1 if i > start and timestamps[i - 1] == timestamps[i] else 0
+        steps[timestamps[i], occurrence] = totals[i] - previous
+        previous = totals[i]
+    return steps
+
+
+def _pick(base, ours, theirs):
+    # three-way pick: their value if ours is unchanged, ours otherwise
+    return theirs if ours == base else ours
+
+
+def merge_histories(ours: Task, theirs: Task,
+                    base: Optional[Task]=None) -> Tuple[array, array, int]:
+    """
+    Merge two versions of a task history, entry by entry, keyed by timestamp.
+    Entries added on either side are kept. With the version both sides started
+    from as 'base', entries dropped (e.g. rolled up, see 'app.rollup') or
+    changed on one side are dropped or changed in the result too; without it,
+    the histories are unioned. Conflicting changes keep our side.
+
+    Args:
+        ours (Task): Our version of the task.
+        theirs (Task): Their version of the task.
+        base (Optional[Task]): Version both sides changed from, if any.
+
+    Returns (Tuple[array, array, int]): Merged timestamps, totals, and
+        currency, the total of the merged history plus any currency not in the
+        history.
+
+    """
+    base_timestamps = base.timestamps if base is not None else array('q')
+    base_totals = base.totals if base is not None else array('q')
+
+    # entries before 'start' are the same on all sides
+    start = min(common_prefix(base_timestamps, base_totals, ours.timestamps, ours.totals),
+                common_prefix(base_timestamps, base_totals, theirs.timestamps, theirs.totals))
+
+    base_steps = history_steps(base_timestamps, base_totals, start)
+    our_steps = history_steps(ours.timestamps, ours.totals, start)
+    their_steps = history_steps(theirs.timestamps, theirs.totals, start)
+
+    timestamps = ours.timestamps[:start]
+    totals = ours.totals[:start]
+    total = totals[-1] if totals else 0
+    for key in sorted(base_steps.keys() | our_steps.keys() | their_steps.keys()):
+        step = _pick(base_steps.get(key), our_steps.get(key), their_steps.get(key))
+        if step is not None:
+            total += step
+            timestamps.append(key[0])
+            totals.append(total)
+
+    def offset(task: Task) -> int:
+        # currency not accounted for by the history
+        return task.currency - (task.totals[-1] if task.totals else 0)
+
+    currency = total + _pick(offset(base) if base is not None else None,
+                             offset(ours), offset(theirs))
+    return timestamps, totals, currency
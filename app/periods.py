@@ -0,0 +1,135 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Union
+
+from .task import Task, to_timestamp
+
+# a period boundary, either relative to now or absolute
+Boundary = Union[timedelta, datetime]
+
+# the last 3, 6 and 9 months
+DEFAULT_BOUNDARIES = (timedelta(days=90), timedelta(days=180), timedelta(days=270))
+
+
+def weeks(*counts: int) -> List[timedelta]:
+    """
+    Period boundaries a number of weeks ago.
+
+    Args:
+        counts (int): Number of weeks ago of each boundary.
+
+    """
+    return [timedelta(weeks=count) for count in counts]
+
+
+def quarters(*counts: int) -> List[timedelta]:
+    """
+    Period boundaries a number of quarters (90 days) ago.
+
+    Args:
+        counts (int): Number of quarters ago of each boundary.
+
+    """
+    return [timedelta(days=90 * count) for count in counts]
+
+
+def _describe(delta: timedelta) -> str:
+    days = delta.days
+    if days and days % 30 == 0:
+        count, unit = days // 30, 'month'
+    elif days and days % 7 == 0:
+        count, unit = days // 7, 'week'
+    else:
+        count, unit = days, 'day'
+    return f'{count} {unit}' + ('s' if count != 1 else '')
+
+
+def period_labels(boundaries: Sequence[Boundary]=DEFAULT_BOUNDARIES) -> List[str]:
+    """
+    Legend labels of the periods split by 'boundaries', newest period first.
+
+    Args:
+        boundaries (Sequence[Boundary]): Period boundaries, newest first.
+
+    """
+    labels = []
+    for boundary in boundaries:
+        if isinstance(boundary, timedelta):
+            labels.append(f'progress last {_describe(boundary)}')
+        else:
+            labels.append(f'progress since {boundary.date().isoformat()}')
+
+    oldest = boundaries[-1]
+    if isinstance(oldest, timedelta):
+        labels.append(f'progress older than {_describe(oldest)}')
+    else:
+        labels.append(f'progress before {oldest.date().isoformat()}')
+    return labels
+
+
+def period_edges(boundaries: Sequence[Boundary]=DEFAULT_BOUNDARIES,
+                 now: Optional[datetime]=None) -> List[int]:
+    """
+    Resolve period boundaries to history timestamps.
+
+    Args:
+        boundaries (Sequence[Boundary]): Period boundaries, newest first.
+        now (Optional[datetime]): Time relative boundaries are resolved
+            against. Defaults to now.
+
+    Returns (List[int]): Timestamps of the boundaries (see 'to_timestamp').
+
+    """
+    if now is None:
+        now = datetime.now()
+    return [to_timestamp(now - boundary if isinstance(boundary, timedelta) else boundary)
+            for boundary in boundaries]
+
+
+def bucket_task(task: Task, edges: Sequence[int]) -> List[int]:
+    """
+    Split a task's history into the periods between 'edges', by binary search.
+
+    Args:
+        task (Task): Task to split.
+        edges (Sequence[int]): Period edge timestamps, newest first.
+
+    Returns (List[int]): For each period, newest first, the task's total at
+        its last increment in the period, or 0 if there were none.
+
+    """
+    # e.g. indexed range queries on a database
+    buckets = task.history_buckets(edges)
+    if buckets is not None:
+        return buckets
+
+    timestamps, totals = task.timestamps, task.totals
+
+    buckets = []
+    end = len(timestamps)
+    for edge in edges:
+        start = bisect_left(timestamps, edge)
+        buckets.append(totals[end - 1] if end > start else 0)
+        end = start
+    buckets.append(totals[end - 1] if end > 0 else 0)
+    return buckets
+
+
+def bucket_tasks(tasks: Sequence[Task], edges: Sequence[int]) -> List[List[int]]:
+    """
+    Split the history of all tasks into the periods between 'edges', in a
+    single pass.
+
+    Args:
+        tasks (Sequence[Task]): Tasks to split.
+        edges (Sequence[int]): Period edge timestamps, newest first.
+
+    Returns (List[List[int]]): For each period, newest first, the bucket of
+        every task (see 'bucket_task').
+
+    """
+    columns = [[] for _ in range(len(edges) + 1)]
+    for task in tasks:
+        for column, bucket in zip(columns, bucket_task(task, edges)):
+            column.append(bucket)
+    return columns
@@ -0,0 +1,277 @@
+"""
+Timing spans around the load, save, bucketing and drawing paths, to tell which
+of them makes the app stutter.
+
+Functions are marked with 'timed', which leaves them untouched unless profiling
+is enabled, by the TRACKER_PROFILE environment variable (the file to dump to)
+or by calling 'enable' (e.g. for the --profile flag). Each span then counts
+its calls, and keeps their total and maximum duration, and a histogram of
+durations in power of two microseconds.
+
+Spans are dumped as JSON at exit, or on demand with 'dump' or SIGUSR1. A single
+call of a span (by default, a graph refresh) can also be captured with
+cProfile or tracemalloc, with 'capture_next', SIGUSR2, or the
+TRACKER_PROFILE_CAPTURE environment variable.
+
+"""
+import atexit
+import functools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+# kinds of capture, see 'capture_next'
+CAPTURE_KINDS = ('cprofile', 'tracemalloc')
+
+# span captured by default, the computation of a graph refresh
+REFRESH_SPAN = 'Graph.prepare'
+
+_enabled = False
+_output = None
+_started = None
+
+# functions marked before profiling was enabled, with their span names
+_registry: List[Tuple[Callable, str]] = []
+
+# span name -> [count, total, max seconds, {histogram bucket: count}]
+_spans: Dict[str, list] = {}
+_lock = threading.Lock()
+
+# span name -> capture kind, for the next call of the span
+_armed: Dict[str, str] = {}
+
+
+def enabled() -> bool:
+    """
+    Whether profiling is enabled.
+
+    """
+    return _enabled
+
+
+def timed(name: Optional[str]=None):
+    """
+    Mark a function or method as a timing span. Returns the function itself
+    while profiling is disabled, and a timing wrapper once it is (see
+    'enable').
+
+    Args:
+        name (Optional[str]): Span name. Defaults to the qualified name of the
+            function.
+
+    """
+    def decorate(function: Callable) -> Callable:
+        span = name or function.__qualname__
+        if _enabled:
+            return _wrap(function, span)
+        _registry.append((function, span))
+        return function
+    return decorate
+
+
+def instrument(owner, attribute: str, name: str) -> None:
+    """
+    Time the calls of an attribute of an object created at runtime (e.g. a
+    canvas 'draw'), if profiling is enabled.
+
+    Args:
+        owner: Object whose attribute to time.
+        attribute (str): Name of the method to time.
+        name (str): Span name.
+
+    """
+    if _enabled:
+        setattr(owner, attribute, _wrap(getattr(owner, attribute), name))
+
+
+def enable(output: Optional[str]=None, capture: Optional[str]=None) -> None:
+    """
+    Enable profiling: functions marked with 'timed' are wrapped, and spans are
+    dumped to 'output' at exit, and on SIGUSR1.
+
+    Args:
+        output (Optional[str]): File to dump the spans to. Defaults to
+            'tracker-profile.json'.
+        capture (Optional[str]): One of 'CAPTURE_KINDS', to capture the first
+            graph refresh (see 'capture_next'), and the next one on each
+            SIGUSR2.
+
+    """
+    global _enabled, _output, _started
+    _output = output or 'tracker-profile.json'
+    if _enabled:
+        return
+    _enabled = True
+    _started = datetime.now()
+
+    for function, span in _registry:
+        _patch(function, span)
+    _registry.clear()
+
+    atexit.register(dump)
+    if capture is not None:
+        capture_next(capture)
+
+    # signals can only be handled by the main thread
+    if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, lambda *_: dump())
+        signal.signal(signal.SIGUSR2, lambda *_: capture_next(capture or 'cprofile'))
+
+
+def capture_next(kind: str, span: str=REFRESH_SPAN) -> None:
+    """
+    Capture the next call of a span with cProfile (saved to the dump file
+    with a '.prof' suffix, for 'pstats') or tracemalloc (top allocation sites
+    saved with a '.tracemalloc.txt' suffix). Profiling must be enabled.
+
+    Args:
+        kind (str): One of 'CAPTURE_KINDS'.
+        span (str): Span to capture. Defaults to a graph refresh.
+
+    """
+    if kind not in CAPTURE_KINDS:
+        raise ValueError(f"Unknown capture kind \"{kind}\".")
+    _armed[span] = kind
+
+
+def stats() -> dict:
+    """
+    Collected spans: count, total, mean and maximum duration, estimated
+    percentiles, and the histogram of durations, in milliseconds.
+
+    """
+    with _lock:
+        spans = {name: (count, total, longest, dict(histogram))
+                 for name, (count, total, longest, histogram) in _spans.items()}
+
+    result = {}
+    for name, (count, total, longest, histogram) in sorted(spans.items()):
+        result[name] = {
+            "count": count,
+            "total_ms": total * 1000,
+            "mean_ms": total / count * 1000,
+            "max_ms": longest * 1000,
+            "p50_ms": min(_percentile(histogram, count, 0.5), longest * 1000),
+            "p90_ms": min(_percentile(histogram, count, 0.9), longest * 1000),
+            "p99_ms": min(_percentile(histogram, count, 0.99), longest * 1000),
+            # upper bound in microseconds -> count
+            "histogram_us": {str(2 ** bucket): histogram[bucket] for bucket in sorted(histogram)},
+        }
+    return result
+
+
+def dump(path: Optional[str]=None) -> None:
+    """
+    Write the collected spans to a JSON file.
+
+    Args:
+        path (Optional[str]): File to write. Defaults to the one given to
+            'enable'.
+
+    """
+    path = path or _output
+    if path is None:
+        return
+    with open(path, 'w') as file:
+        json.dump({
+            "pid": os.getpid(),
+            "started": _started.isoformat() if _started else None,
+            "dumped": datetime.now().isoformat(),
+            "spans": stats(),
+        }, file, indent=2)
+    print(f'Profile written to {path}', file=sys.stderr)
+
+
+def _percentile(histogram: Dict[int, int], count: int, fraction: float) -> float:
+    # upper bound of the bucket holding the percentile, in milliseconds
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= fraction * count:
+            return 2 ** bucket / 1000
+    return 0.0
+
+
+def _record(span: str, duration: float) -> None:
+    bucket = int(duration * 1e6).bit_length()
+    with _lock:
+        stats = _spans.get(span)
+        if stats is None:
+            stats = _spans[span] = [0, 0.0, 0.0, {}]
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] = max(stats[2], duration)
+        stats[3][bucket] = stats[3].get(bucket, 0) + 1
+
+
+def _capture(kind: str, span: str, function: Callable, args, kwargs):
+    # only imported when capturing
+    import cProfile
+    import tracemalloc
+
+    base = _output or 'tracker-profile.json'
+    if kind == 'cprofile':
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args, **kwargs)
+        finally:
+            profile.dump_stats(base + '.prof')
+            print(f'Profile of {span} written to {base}.prof', file=sys.stderr)
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start(25)
+    before = tracemalloc.take_snapshot()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        after = tracemalloc.take_snapshot()
+        if not tracing:
+            tracemalloc.stop()
+
+        # leave out the allocations of the capture itself
+        ignored = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        before, after = before.filter_traces(ignored), after.filter_traces(ignored)
+        with open(base + '.tracemalloc.txt', 'w') as file:
+            file.write(f'Allocations of {span}, by line:\n')
+            for stat in after.compare_to(before, 'lineno')[:50]:
+                file.write(f'{stat}\n')
+        print(f'Allocations of {span} written to {base}.tracemalloc.txt', file=sys.stderr)
+
+
+def _wrap(function: Callable, span: str) -> Callable:
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        kind = _armed.pop(span, None) if _armed else None
+        start = time.perf_counter()
+        try:
+            if kind is not None:
+                return _capture(kind, span, function, args, kwargs)
+            return function(*args, **kwargs)
+        finally:
+            _record(span, time.perf_counter() - start)
+    return wrapper
+
+
+def _patch(function: Callable, span: str) -> None:
+    # replace the marked function where it was defined
+    owner = sys.modules[function.__module__]
+    *path, attribute = function.__qualname__.split('.')
+    for part in path:
+        owner = getattr(owner, part)
+
+    current = owner.__dict__.get(attribute)
+    if isinstance(current, (classmethod, staticmethod)) and current.__func__ is function:
+        setattr(owner, attribute, type(current)(_wrap(function, span)))
+    elif current is function:
+        setattr(owner, attribute, _wrap(function, span))
+
+
+# enabled from the environment as early as possible, so that no span is missed
+if os.getenv('TRACKER_PROFILE'):
+    enable(os.getenv('TRACKER_PROFILE'), os.getenv('TRACKER_PROFILE_CAPTURE') or None)
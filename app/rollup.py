@@ -0,0 +1,212 @@
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from .task import Task, to_timestamp
+
+DAY = 86400 * 1000000
+WEEK = 7 * DAY
+
+# timestamps count from a Thursday, weeks start on Monday
+_MONDAY = 4 * DAY
+
+
+def day_start(timestamp: int) -> int:
+    """
+    Timestamp of the midnight starting the day of 'timestamp'.
+
+    """
+    return timestamp - timestamp % DAY
+
+
+def week_start(timestamp: int) -> int:
+    """
+    Timestamp of the midnight starting the week (on Monday) of 'timestamp'.
+
+    """
+    return timestamp - (timestamp - _MONDAY) % WEEK
+
+
+def dropped_entries(timestamps: Sequence[int],
+                    raw_cutoff: int,
+                    daily_cutoff: int,
+                    since: Optional[int]=None) -> List[int]:
+    """
+    Indices of the history entries dropped by rolling up entries older than
+    'raw_cutoff' into their last entry of each day, and entries older than
+    'daily_cutoff' into their last entry of each week. The running total is
+    kept at every day and week boundary.
+
+    Args:
+        timestamps (Sequence[int]): History timestamps, in chronological order.
+        raw_cutoff (int): Entries from here on are kept. Must be the start of
+            a day.
+        daily_cutoff (int): Entries from here on, up to 'raw_cutoff', are kept
+            per day. Must be the start of a week.
+        since (Optional[int]): Entries before this are already rolled up, by a
+            previous rollup with cutoffs no newer than these. Must be the
+            start of a week. Defaults to rolling up everything.
+
+    Returns (List[int]): Indices of the dropped entries, in order.
+
+    """
+    start = bisect_left(timestamps, since) if since is not None else 0
+    end = bisect_left(timestamps, raw_cutoff)
+
+    def group(timestamp: int) -> int:
+        # weeks never straddle the daily cutoff, so groups don't collide
+        return week_start(timestamp) if timestamp < daily_cutoff else day_start(timestamp)
+
+    # keep the last entry of each group
+    return [i for i in range(start, end - 1)
+            if group(timestamps[i + 1]) == group(timestamps[i])]
+
+
+def rollup(timestamps: array,
+           totals: array,
+           raw_cutoff: int,
+           daily_cutoff: int,
+           since: Optional[int]=None) -> Tuple[array, array]:
+    """
+    Roll up a task history (see 'dropped_entries').
+
+    Returns (Tuple[array, array]): Rolled up timestamps and totals, or the
+        same arrays if no entries are dropped.
+
+    """
+    dropped = dropped_entries(timestamps, raw_cutoff, daily_cutoff, since)
+    if not dropped:
+        return timestamps, totals
+
+    rolled_timestamps = array('q')
+    rolled_totals = array('q')
+    previous = 0
+    for i in dropped:
+        rolled_timestamps.extend(timestamps[previous:i])
+        rolled_totals.extend(totals[previous:i])
+        previous = i + 1
+    rolled_timestamps.extend(timestamps[previous:])
+    rolled_totals.extend(totals[previous:])
+    return rolled_timestamps, rolled_totals
+
+
+def rollup_task(task: Task, raw_cutoff: int, daily_cutoff: int,
+                since: Optional[int]=None) -> bool:
+    """
+    Roll up a task history (see 'rollup').
+
+    Returns (bool): Whether any history entries were rolled up.
+
+    """
+    timestamps, totals = rollup(task.timestamps, task.totals, raw_cutoff, daily_cutoff, since)
+    if timestamps is task.timestamps:
+        return False
+    task.timestamps, task.totals = timestamps, totals
+    return True
+
+
+class RetentionPolicy:
+    def __init__(self, raw_days: int=30, daily_days: int=365):
+        """
+        Retention policy for task histories: entries of the last 'raw_days'
+        days are kept as they are, older entries up to 'daily_days' days ago
+        are rolled up per day, and older ones per week (see 'rollup').
+
+        Period totals stay the same on rolled up histories, as long as the
+        period edges are snapped to the resolution of their tier (see
+        'snap_edges').
+
+        Args:
+            raw_days (int): Days of history kept as is. Defaults to 30.
+            daily_days (int): Days of history kept at least per day. Defaults
+                to 365.
+
+        """
+        if raw_days < 0 or daily_days < raw_days:
+            raise ValueError("Retention must keep raw history for 'raw_days' "
+                             "days, then daily history up to 'daily_days' days.")
+        self.raw_days = raw_days
+        self.daily_days = daily_days
+
+        # task name -> (task, daily cutoff and raw cutoff of its last rollup)
+        self._marks = {}
+
+    def cutoffs(self, now: Optional[datetime]=None) -> Tuple[int, int]:
+        """
+        Tier cutoffs at 'now'.
+
+        Args:
+            now (Optional[datetime]): Defaults to now.
+
+        Returns (Tuple[int, int]): Raw cutoff (start of a day) and daily
+            cutoff (start of a week) timestamps.
+
+        """
+        now = to_timestamp(now if now is not None else datetime.now())
+        raw_cutoff = day_start(now - self.raw_days * DAY)
+        daily_cutoff = week_start(now - self.daily_days * DAY)
+        return raw_cutoff, min(daily_cutoff, week_start(raw_cutoff))
+
+    def snap_edges(self, edges: Sequence[int], now: Optional[datetime]=None) -> List[int]:
+        """
+        Snap period edges to the start of their day in the daily tier, and to
+        the start of their week in the weekly tier, so that periods split the
+        same totals whether or not the history is rolled up.
+
+        Args:
+            edges (Sequence[int]): Period edge timestamps.
+            now (Optional[datetime]): Defaults to now.
+
+        Returns (List[int]): Snapped edges.
+
+        """
+        raw_cutoff, daily_cutoff = self.cutoffs(now)
+        snapped = []
+        for edge in edges:
+            if edge < daily_cutoff:
+                edge = week_start(edge)
+            elif edge < raw_cutoff:
+                edge = day_start(edge)
+            snapped.append(edge)
+        return snapped
+
+    def compact(self, tracker, now: Optional[datetime]=None) -> int:
+        """
+        Roll up the loaded task histories of a task tracker. Incremental: only
+        the part of each history that aged into another tier since its last
+        rollup is processed, and nothing is done until the cutoffs move (i.e.
+        once a day).
+
+        Args:
+            tracker (TaskTracker): Task tracker to compact.
+            now (Optional[datetime]): Defaults to now.
+
+        Returns (int): Number of task histories rolled up.
+
+        """
+        raw_cutoff, daily_cutoff = self.cutoffs(now)
+
+        count = 0
+        marks = {}
+        for task in tracker.tasks:
+            # histories not loaded yet are rolled up once loaded
+            if not task.history_loaded:
+                continue
+
+            mark = self._marks.get(task.name)
+            if mark is not None and mark[0] is task:
+                since = mark[1]
+                if mark[1:] == (daily_cutoff, raw_cutoff):
+                    marks[task.name] = mark
+                    continue
+            else:
+                since = None
+
+            if tracker.rollup_task(task.name, raw_cutoff, daily_cutoff, since):
+                count += 1
+            marks[task.name] = (task, daily_cutoff, raw_cutoff)
+
+        self._marks = marks
+        return count
+
@@ -0,0 +1,252 @@
+import os
+import sqlite3
+import threading
+from array import array
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from .rollup import dropped_entries
+from .task import HistorySource, Task, parse_history, to_timestamp
+
+# extensions of save files stored with SQLite
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    currency_name TEXT NOT NULL,
+    currency INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history (
+    task_id INTEGER NOT NULL REFERENCES tasks (id) ON DELETE CASCADE,
+    timestamp INTEGER NOT NULL,
+    total INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_task_timestamp ON history (task_id, timestamp);
+'''
+
+
+class SQLiteHistorySource(HistorySource):
+    __slots__ = ('store', 'task_id')
+
+    def __init__(self, store: 'SQLiteStore', task_id: int):
+        """
+        Task history stored in the 'history' table of a SQLite save file.
+
+        Args:
+            store (SQLiteStore): Store holding the history.
+            task_id (int): Id of the task in the store.
+
+        """
+        self.store = store
+        self.task_id = task_id
+
+    def load(self) -> Tuple[array, array]:
+        rows = self.store.query(
+            'SELECT timestamp, total FROM history WHERE task_id = ? ORDER BY timestamp, rowid',
+            (self.task_id,))
+        return array('q', [row[0] for row in rows]), array('q', [row[1] for row in rows])
+
+    def last_timestamp(self) -> Optional[int]:
+        rows = self.store.query('SELECT MAX(timestamp) FROM history WHERE task_id = ?',
+                                (self.task_id,))
+        return rows[0][0] if rows else None
+
+    def buckets(self, edges: Sequence[int]) -> Optional[List[int]]:
+        # one indexed range lookup per period, newest first
+        bounds = [None] + list(edges) + [None]
+        buckets = []
+        for end, start in zip(bounds, bounds[1:]):
+            query = 'SELECT total FROM history WHERE task_id = ?'
+            params = [self.task_id]
+            if start is not None:
+                query += ' AND timestamp >= ?'
+                params.append(start)
+            if end is not None:
+                query += ' AND timestamp < ?'
+                params.append(end)
+            rows = self.store.query(query + ' ORDER BY timestamp DESC, rowid DESC LIMIT 1', params)
+            buckets.append(rows[0][0] if rows else 0)
+        return buckets
+
+
+class SQLiteStore:
+    def __init__(self, db_file_path: str):
+        """
+        Task tracker storage in a SQLite database, with a 'tasks' table and a
+        'history' table indexed on (task, timestamp). Once attached to a task
+        tracker, every change is written right away, in its own transaction.
+
+        Args:
+            db_file_path (str): Path to the database file, created if missing.
+
+        """
+        self.db_file_path = db_file_path
+        self.tracker = None
+
+        # the connection is shared with threads loading task histories
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(db_file_path, check_same_thread=False)
+        self._connection.execute('PRAGMA foreign_keys = ON')
+        self._connection.execute('PRAGMA journal_mode = WAL')
+        self._connection.executescript(_SCHEMA)
+
+    def query(self, query: str, params: Sequence=()) -> List[tuple]:
+        """
+        Run a read query.
+
+        Args:
+            query (str): SQL query.
+            params (Sequence): Query parameters.
+
+        Returns (List[tuple]): Result rows.
+
+        """
+        with self._lock:
+            return self._connection.execute(query, params).fetchall()
+
+    def load(self, lazy: bool=False) -> List[Task]:
+        """
+        Load the tasks stored in the database.
+
+        Args:
+            lazy (bool): Whether to load each task history the first time it is
+                needed. Defaults to False.
+
+        Returns (List[Task]): Stored tasks.
+
+        """
+        tasks = []
+        rows = self.query('SELECT id, name, currency_name, currency FROM tasks ORDER BY id')
+        for task_id, name, currency_name, currency in rows:
+            task = Task.lazy(name, currency_name, currency, SQLiteHistorySource(self, task_id))
+            if not lazy:
+                task.load_history()
+            tasks.append(task)
+        return tasks
+
+    def write(self, tasks: List[Task]) -> None:
+        """
+        Replace the stored tasks with 'tasks', in a single transaction.
+
+        Args:
+            tasks (List[Task]): Tasks to store.
+
+        """
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM tasks')
+            for task in tasks:
+                self._insert_task(task.name, task.currency_name, task.currency,
+                                  zip(task.timestamps, task.totals))
+
+    def attach(self, tracker) -> None:
+        """
+        Start writing the task tracker changes to the database.
+
+        Args:
+            tracker (TaskTracker): Task tracker loaded from the database.
+
+        """
+        self.tracker = tracker
+        tracker.add_listener(self.apply)
+
+    def close(self) -> None:
+        """
+        Stop writing the task tracker changes, and close the database.
+
+        """
+        if self.tracker is not None:
+            self.tracker.remove_listener(self.apply)
+            self.tracker = None
+        with self._lock:
+            self._connection.close()
+
+    def apply(self, records: List[dict]) -> None:
+        """
+        Write change records to the database, in a single transaction.
+        Registered as a task tracker listener by 'attach'.
+
+        Args:
+            records (List[dict]): Change records.
+
+        """
+        with self._lock, self._connection:
+            for record in records:
+                if record["op"] == "add":
+                    task = record["task"]
+                    timestamps, totals = parse_history(task["history"])
+                    self._insert_task(task["name"], task["currency_name"],
+                                      task["currency"], zip(timestamps, totals))
+                elif record["op"] == "remove":
+                    self._connection.execute('DELETE FROM tasks WHERE name = ?',
+                                             (record["name"],))
+                elif record["op"] == "increment":
+                    self._increment(record["name"], record["step"],
+                                    to_timestamp(datetime.fromisoformat(record["timestamp"])))
+                elif record["op"] == "rollup":
+                    self._rollup(record["name"], record["raw_cutoff"],
+                                 record["daily_cutoff"], record.get("since"))
+
+    def _insert_task(self, name: str, currency_name: str, currency: int, history) -> None:
+        cursor = self._connection.execute(
+            'INSERT INTO tasks (name, currency_name, currency) VALUES (?, ?, ?)',
+            (name, currency_name, currency))
+        task_id = cursor.lastrowid
+        self._connection.executemany(
+            'INSERT INTO history (task_id, timestamp, total) VALUES (?, ?, ?)',
+            ((task_id, timestamp, total) for timestamp, total in history))
+
+    def _increment(self, name: str, step: int, timestamp: int) -> None:
+        row = self._connection.execute('SELECT id FROM tasks WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return
+        task_id = row[0]
+
+        # same as Task.increment: the total right after the previous entry,
+        # and later entries (if any, the increment is usually the newest) move
+        # up by 'step'
+        self._connection.execute(
+            'INSERT INTO history (task_id, timestamp, total) VALUES (?, ?, ? + COALESCE(('
+            'SELECT total FROM history WHERE task_id = ? AND timestamp <= ? '
+            'ORDER BY timestamp DESC, rowid DESC LIMIT 1), 0))',
+            (task_id, timestamp, step, task_id, timestamp))
+        self._connection.execute(
+            'UPDATE history SET total = total + ? WHERE task_id = ? AND timestamp > ?',
+            (step, task_id, timestamp))
+        self._connection.execute(
+            'UPDATE tasks SET currency = currency + ? WHERE id = ?', (step, task_id))
+
+    def _rollup(self, name: str, raw_cutoff: int, daily_cutoff: int,
+                since: Optional[int]) -> None:
+        row = self._connection.execute('SELECT id FROM tasks WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return
+
+        # same entries as dropped from the task history
+        query = 'SELECT rowid, timestamp FROM history WHERE task_id = ? AND timestamp < ?'
+        params = [row[0], raw_cutoff]
+        if since is not None:
+            query += ' AND timestamp >= ?'
+            params.append(since)
+        rows = self._connection.execute(query + ' ORDER BY timestamp, rowid', params).fetchall()
+
+        dropped = dropped_entries([row[1] for row in rows], raw_cutoff, daily_cutoff)
+        self._connection.executemany('DELETE FROM history WHERE rowid = ?',
+                                     ((rows[i][0],) for i in dropped))
+
+
+def is_sqlite(file_path: str) -> bool:
+    """
+    Whether a file is a SQLite save file, by its contents or, for missing or
+    empty files, its extension.
+
+    Args:
+        file_path (str): Path to the file.
+
+    """
+    if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+        with open(file_path, 'rb') as file:
+            return file.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    return os.path.splitext(file_path)[1].lower() in SQLITE_EXTENSIONS
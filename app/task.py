@@ -1,11 +1,137 @@
-from datetime import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+# history timestamps are stored as microseconds since this (naive, local time)
+# epoch, which converts losslessly to and from naive datetimes
+_EPOCH = datetime(1970, 1, 1)
+
+# microseconds in a day, local days start at multiples of it
+_DAY = 86400 * 1000000
+
+
+def to_timestamp(moment: datetime) -> int:
+    """
+    Convert a datetime to a history timestamp.
+
+    Args:
+        moment (datetime): Datetime to convert. Aware datetimes are converted
+            to local time first.
+
+    Returns (int): Microseconds since the epoch.
+
+    """
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    delta = moment - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def from_timestamp(timestamp: int) -> datetime:
+    """
+    Convert a history timestamp to a (naive, local time) datetime.
+
+    Args:
+        timestamp (int): Microseconds since the epoch.
+
+    Returns (datetime): The converted datetime.
+
+    """
+    return _EPOCH + timedelta(microseconds=timestamp)
+
+
+def parse_history(history: List[dict]) -> Tuple[array, array]:
+    """
+    Convert a list of {"total_currency", "timestamp"} dicts, newest first, to
+    chronological timestamp and total arrays.
+
+    Args:
+        history (List[dict]): History to convert.
+
+    Returns (Tuple[array, array]): Timestamps and totals.
+
+    """
+    entries = [(to_timestamp(datetime.fromisoformat(item["timestamp"])),
+                item["total_currency"]) for item in reversed(history)]
+
+    # history is expected newest first, but don't rely on it
+    if any(entries[i][0] > entries[i + 1][0] for i in range(len(entries) - 1)):
+        entries.sort(key=lambda entry: entry[0])
+
+    return array('q', [entry[0] for entry in entries]), \
+        array('q', [entry[1] for entry in entries])
+
+
+def _extend_streak(streak: tuple, day: int) -> tuple:
+    # streak state (see 'Task._streak') after an entry on 'day', at or after
+    # the day of the newest entry
+    longest, current, last_day = streak
+    if day == last_day:
+        return streak
+    current = current + 1 if last_day is not None and day == last_day + 1 else 1
+    return max(longest, current), current, day
+
+
+class HistorySource:
+    """
+    Source of a task history that is only loaded the first time it is needed.
+
+    """
+    def load(self) -> Tuple[array, array]:
+        """
+        Load the history.
+
+        Returns (Tuple[array, array]): Timestamps and totals.
+
+        """
+        raise NotImplementedError
+
+    def json_text(self) -> Optional[str]:
+        """
+        Get the history as JSON text, as written to a save file, if it can be
+        had without loading it.
+
+        """
+        return None
+
+    def binary(self) -> Optional[Tuple[bytes, int]]:
+        """
+        Get the history as encoded in a binary save file, and its number of
+        entries, if it can be had without loading it.
+
+        """
+        return None
+
+    def buckets(self, edges: Sequence[int]) -> Optional[List[int]]:
+        """
+        Split the history into periods (see 'app.periods.bucket_task'), if it
+        can be done without loading it.
+
+        """
+        return None
+
+    def last_timestamp(self) -> Optional[int]:
+        """
+        Get the timestamp of the newest history entry, if it can be had without
+        loading the history.
+
+        """
+        return None
 
 
 class Task:
+    __slots__ = ('name', 'currency_name', 'currency', 'version',
+                 '_timestamps', '_totals', '_source', '_streak')
+
     def __init__(self, name: str, currency_name="steps"):
         """
         Create a task.
 
+        The task history is kept as two parallel arrays, in chronological
+        order: 'timestamps' (see 'to_timestamp') and 'totals', the task currency
+        right after each increment.
+
         Args:
             name (str): Name of task.
             currency_name (str): Currency name of task. Defaults to 'steps'.
@@ -20,23 +146,316 @@ class Task:
         self.currency_name = currency_name
 
         self.currency = 0
-        self.history = []
+        # bumped on every change to the history, for values cached from it
+        self.version = 0
+        self._timestamps = array('q')
+        self._totals = array('q')
+        self._source = None
+        # (longest streak, streak of the newest entry, day of the newest
+        # entry), computed on first use and kept up to date by 'increment'
+        self._streak = None
+
+    @classmethod
+    def lazy(cls, name: str, currency_name: str, currency: int,
+             source: HistorySource) -> 'Task':
+        """
+        Create a task whose history is loaded from 'source' on first use.
+
+        Args:
+            name (str): Name of task.
+            currency_name (str): Currency name of task.
+            currency (int): Currency of task.
+            source (HistorySource): Source of the task history.
+
+        """
+        task = cls(name, currency_name)
+        task.currency = currency
+        task._source = source
+        return task
+
+    @property
+    def history_loaded(self) -> bool:
+        """
+        Whether the task history is loaded (see 'Task.lazy').
+
+        """
+        return self._source is None
+
+    def load_history(self) -> None:
+        """
+        Load the task history, if it is not loaded yet (see 'Task.lazy').
+
+        """
+        if self._source is not None:
+            self._timestamps, self._totals = self._source.load()
+            self._source = None
+
+    @property
+    def timestamps(self) -> array:
+        """
+        History timestamps, in chronological order (see 'to_timestamp').
+
+        """
+        if self._source is not None:
+            self.load_history()
+        return self._timestamps
+
+    @timestamps.setter
+    def timestamps(self, timestamps: array) -> None:
+        if self._source is not None:
+            self.load_history()
+        self._timestamps = timestamps
+        self._streak = None
+        self.version += 1
+
+    @property
+    def totals(self) -> array:
+        """
+        History totals, the task currency right after each increment.
 
-    def increment(self, step: int=1) -> None:
+        """
+        if self._source is not None:
+            self.load_history()
+        return self._totals
+
+    @totals.setter
+    def totals(self, totals: array) -> None:
+        if self._source is not None:
+            self.load_history()
+        self._totals = totals
+        self._streak = None
+        self.version += 1
+
+    def history_json_text(self) -> Optional[str]:
+        """
+        Get the history as JSON text without loading it, if the task history is
+        not loaded yet and its source allows it.
+
+        """
+        if self._source is None:
+            return None
+        return self._source.json_text()
+
+    def history_binary(self) -> Optional[Tuple[bytes, int]]:
+        """
+        Get the history as encoded in a binary save file, and its number of
+        entries, without loading it, if the task history is not loaded yet and
+        its source allows it.
+
+        """
+        if self._source is None:
+            return None
+        return self._source.binary()
+
+    def history_buckets(self, edges: Sequence[int]) -> Optional[List[int]]:
+        """
+        Split the history into periods (see 'app.periods.bucket_task') without
+        loading it, if the task history is not loaded yet and its source allows
+        it.
+
+        """
+        if self._source is None:
+            return None
+        return self._source.buckets(edges)
+
+    @property
+    def last_timestamp(self) -> Optional[int]:
+        """
+        Timestamp of the newest history entry, or None if the history is
+        empty. Read from the history source without loading the history, if
+        it is not loaded yet and its source allows it.
+
+        """
+        if self._source is not None:
+            timestamp = self._source.last_timestamp()
+            if timestamp is not None:
+                return timestamp
+        timestamps = self.timestamps
+        return timestamps[-1] if timestamps else None
+
+    @property
+    def history(self) -> List[dict]:
+        """
+        Task history, as a list of {"total_currency", "timestamp"} dicts, newest
+        first, with ISO format timestamps. Built on every access, so prefer
+        'timestamps' and 'totals' where possible.
+
+        """
+        return [{
+            "total_currency": total,
+            "timestamp": from_timestamp(timestamp).isoformat()
+        } for timestamp, total in zip(reversed(self.timestamps), reversed(self.totals))]
+
+    @history.setter
+    def history(self, history: List[dict]) -> None:
+        self._source = None
+        self._timestamps, self._totals = parse_history(history)
+        self._streak = None
+        self.version += 1
+
+    def increment(self, step: int=1, timestamp: Optional[datetime]=None) -> None:
         """
         Increment the currency of the task by 'step' steps, and add timestamp to
-        beggining of history.
+        history.
 
         Args:
             step (int): Increment by these many steps. Defaults to 1.
+            timestamp (Optional[datetime]): Time of the increment. Defaults to
+                now.
 
         """
         self.currency += step
-        timestamp = datetime.now().isoformat()
-        self.history.insert(0, {
-            "total_currency": self.currency,
-            "timestamp": timestamp
-        })
+        self.version += 1
+        if timestamp is None:
+            timestamp = datetime.now()
+        timestamp = to_timestamp(timestamp)
+        timestamps, totals = self.timestamps, self.totals
+
+        # common case, the increment is the newest
+        if not timestamps or timestamp >= timestamps[-1]:
+            timestamps.append(timestamp)
+            totals.append(self.currency)
+            if self._streak is not None:
+                self._streak = _extend_streak(self._streak, timestamp // _DAY)
+            return
+
+        # otherwise, keep history sorted and the later totals consistent;
+        # streaks only change if the day had no entries
+        day = timestamp // _DAY
+        start = bisect_left(timestamps, day * _DAY)
+        if start == len(timestamps) or timestamps[start] >= (day + 1) * _DAY:
+            self._streak = None
+        index = bisect_right(timestamps, timestamp)
+        total = totals[index - 1] + step if index > 0 else step
+        timestamps.insert(index, timestamp)
+        totals.insert(index, total)
+        for i in range(index + 1, len(totals)):
+            totals[i] += step
+
+    def total_at(self, moment: datetime) -> int:
+        """
+        Get the task currency right before a moment, by binary search.
+
+        Args:
+            moment (datetime): Moment to get the currency at.
+
+        Returns (int): Total of the increments before 'moment'.
+
+        """
+        timestamps = self.timestamps
+        index = bisect_left(timestamps, to_timestamp(moment))
+        return self.totals[index - 1] if index > 0 else 0
+
+    def progress(self, start: datetime, end: Optional[datetime]=None) -> int:
+        """
+        Get the progress made in a time range, by binary search. On rolled up
+        histories (see 'app.rollup'), progress is exact at the rolled up
+        period boundaries, and approximate within them.
+
+        Args:
+            start (datetime): Start of the range, included.
+            end (Optional[datetime]): End of the range, excluded. Defaults to
+                no end.
+
+        Returns (int): Total of the increments in the range.
+
+        """
+        # e.g. indexed range queries on a database, the bucket before each
+        # edge holds the total right before it, or 0 if empty; a range ending
+        # at a total of 0 (e.g. after negative steps) looks empty, and is read
+        # from the history instead
+        edges = [to_timestamp(start)] if end is None else [to_timestamp(end), to_timestamp(start)]
+        buckets = self.history_buckets(edges)
+        if buckets is not None and (buckets[-2] or not buckets[-1]):
+            return buckets[-2] - buckets[-1]
+
+        totals = self.totals
+        if end is None:
+            before_end = totals[-1] if totals else 0
+        else:
+            before_end = self.total_at(end)
+        return before_end - self.total_at(start)
+
+    def average_per_day(self, days: float, now: Optional[datetime]=None) -> float:
+        """
+        Get the average progress per day over the last days.
+
+        Args:
+            days (float): Number of days to average over, positive.
+            now (Optional[datetime]): End of the days. Defaults to now.
+
+        Returns (float): Average progress per day.
+
+        Raises:
+            ValueError: If 'days' is not positive.
+
+        """
+        if not days > 0:
+            raise ValueError("'days' must be positive!")
+        if now is None:
+            now = datetime.now()
+        return self.progress(now - timedelta(days=days), now) / days
+
+    @property
+    def last_active(self) -> Optional[datetime]:
+        """
+        Time of the newest history entry, or None if the history is empty (see
+        'last_timestamp').
+
+        """
+        timestamp = self.last_timestamp
+        return from_timestamp(timestamp) if timestamp is not None else None
+
+    @property
+    def longest_streak(self) -> int:
+        """
+        Longest run of consecutive (local) days with increments. Rolled up
+        histories (see 'app.rollup') keep at most an entry per day or week, so
+        their streaks can only be shorter.
+
+        """
+        if self._streak is None:
+            streak = (0, 0, None)
+            for timestamp in self.timestamps:
+                streak = _extend_streak(streak, timestamp // _DAY)
+            self._streak = streak
+        return self._streak[0]
+
+    def copy(self) -> 'Task':
+        """
+        Create a copy of the task, with its own history.
+
+        """
+        task = Task(self.name, self.currency_name)
+        task.currency = self.currency
+        task.version = self.version
+        task._streak = self._streak
+        if self._source is not None:
+            # sources are immutable, no need to load the history
+            task._source = self._source
+        else:
+            task._timestamps = self._timestamps[:]
+            task._totals = self._totals[:]
+        return task
+
+    def adopt_history(self, other: 'Task') -> bool:
+        """
+        Take the history loaded by a copy of the task (see 'copy'), e.g. on
+        another thread, if this task's history is not loaded yet and neither
+        task changed since the copy.
+
+        Args:
+            other (Task): Copy of the task.
+
+        Returns (bool): Whether the history was taken.
+
+        """
+        if self._source is None or other._source is not None or other.version != self.version:
+            return False
+        # the copy keeps its own history
+        self._timestamps, self._totals = other._timestamps[:], other._totals[:]
+        self._source = None
+        return True
 
     def export_to_dict(self) -> dict:
         """
@@ -1,15 +1,216 @@
 import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set
 
+from .atomic import atomic_write
+from .binary_format import is_binary, load_binary, write_binary
+from .lazy_json import load_lazy
+from .merge import merge_histories
+from .profiling import timed
+from .rollup import RetentionPolicy, rollup_task
+from .sqlite_store import SQLiteStore, is_sqlite
 from .task import Task
 
 
+# supported save file formats
+SAVE_FORMATS = ('json', 'binary', 'sqlite')
+
+
 class TaskTracker:
     def __init__(self):
         """
         Create a task tracker.
 
         """
-        self.tasks = []
+        # tasks indexed by name, in insertion order
+        self._tasks = {}
+
+        # callables notified with the list of change records of each mutation
+        self._listeners = []
+
+        # guards the tasks against concurrent mutation and snapshots
+        self.lock = threading.RLock()
+
+        # change records held back until the end of the current batch, if any
+        self._batch = None
+
+        # how task histories are rolled up by 'compact_history', if at all
+        self.retention: Optional[RetentionPolicy] = None
+
+    @property
+    def tasks(self) -> List[Task]:
+        """
+        List of tasks in the task tracker, in insertion order.
+
+        """
+        return list(self._tasks.values())
+
+    def newest_tasks(self, start: int=0, count: Optional[int]=None) -> List[Task]:
+        """
+        Get a page of tasks, most recently added first, without listing all the
+        tasks.
+
+        Args:
+            start (int): Position of the first task of the page, 0 for the most
+                recently added one.
+            count (Optional[int]): Number of tasks in the page. Defaults to all
+                the remaining tasks.
+
+        Returns (List[Task]): Tasks of the page, most recently added first.
+
+        """
+        with self.lock:
+            stop = None if count is None else start + count
+            return list(islice(reversed(self._tasks.values()), start, stop))
+
+    def get_task(self, task_name: str) -> Optional[Task]:
+        """
+        Get a task by name.
+
+        Args:
+            task_name (str): Name of the task.
+
+        Returns (Optional[Task]): The task, or None if there is no such task.
+
+        """
+        return self._tasks.get(task_name)
+
+    def add_listener(self, listener: Callable[[List[dict]], None]) -> None:
+        """
+        Register a listener for task tracker changes.
+
+        Every mutation calls the listener with a list of change records, which
+        are JSON-serializable dicts with an "op" key ("add", "remove",
+        "increment" or "rollup"), and can be re-applied with 'apply_record'.
+
+        Args:
+            listener (Callable[[List[dict]], None]): Listener to register.
+
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[List[dict]], None]) -> None:
+        """
+        Unregister a listener for task tracker changes.
+
+        Args:
+            listener (Callable[[List[dict]], None]): Listener to unregister.
+
+        """
+        self._listeners.remove(listener)
+
+    def _notify(self, records: List[dict]) -> None:
+        if self._batch is not None:
+            self._batch.extend(records)
+            return
+        for listener in self._listeners:
+            listener(records)
+
+    @contextmanager
+    def batch(self) -> Iterator['TaskTracker']:
+        """
+        Group mutations into a batch: the task tracker is locked for the whole
+        batch, and listeners are notified once at its end, with the change
+        records of all its mutations. Batches can be nested, the outermost one
+        notifies.
+
+        Mutations are not rolled back if the batch raises; the changes made so
+        far are still notified. Use 'apply_batch' to check a batch before
+        applying it.
+
+        """
+        with self.lock:
+            if self._batch is not None:
+                yield self
+                return
+
+            self._batch = []
+            try:
+                yield self
+            finally:
+                records, self._batch = self._batch, None
+                if records:
+                    self._notify(records)
+
+    def apply_batch(self, ops: Sequence[tuple]) -> None:
+        """
+        Apply a batch of mutations atomically: the whole batch is checked
+        first, and either fails without changes or is applied at once, with a
+        single listener notification (see 'batch').
+
+        Each mutation is a tuple of:
+            ("add", task name, currency name)
+            ("remove", task name)
+            ("increment", task name, step) or
+            ("increment", task name, step, timestamp)
+
+        Args:
+            ops (Sequence[tuple]): Mutations to apply, in order.
+
+        Raises:
+            ValueError: If a mutation is invalid, or can't be applied after the
+                ones before it (e.g. an increment of a missing task).
+
+        """
+        with self.lock:
+            # task names as they will be after each mutation
+            names = set(self._tasks)
+            for i, op in enumerate(ops):
+                if not isinstance(op, (tuple, list)) or len(op) < 2:
+                    raise ValueError(f"Mutation {i}: expected (operation, name, ...).")
+                kind, task_name = op[0], op[1]
+                if not isinstance(task_name, str):
+                    raise ValueError(f"Mutation {i}: task name must be string!")
+                if kind == "add":
+                    if len(op) != 3 or (op[2] and not isinstance(op[2], str)):
+                        raise ValueError(f"Mutation {i}: expected (\"add\", name, currency name).")
+                    if task_name in names:
+                        raise ValueError(f"Mutation {i}: task \"{task_name}\" already exists.")
+                    names.add(task_name)
+                elif kind == "remove":
+                    if len(op) != 2:
+                        raise ValueError(f"Mutation {i}: expected (\"remove\", name).")
+                    if task_name not in names:
+                        raise ValueError(f"Mutation {i}: no such task \"{task_name}\".")
+                    names.discard(task_name)
+                elif kind == "increment":
+                    # bools are ints too
+                    if len(op) not in (3, 4) or isinstance(op[2], bool) or \
+                            not isinstance(op[2], int) or \
+                            (len(op) == 4 and op[3] is not None and not isinstance(op[3], datetime)):
+                        raise ValueError(f"Mutation {i}: expected (\"increment\", name, "
+                                         "step, optional timestamp).")
+                    if task_name not in names:
+                        raise ValueError(f"Mutation {i}: no such task \"{task_name}\".")
+                else:
+                    raise ValueError(f"Mutation {i}: unknown operation \"{kind}\".")
+
+            with self.batch():
+                for op in ops:
+                    if op[0] == "add":
+                        self.create_and_add_task(op[1], op[2])
+                    elif op[0] == "remove":
+                        self.remove_task(op[1])
+                    else:
+                        self.increase_task_currency(*op[1:])
+
+    def snapshot(self) -> 'TaskTracker':
+        """
+        Create a detached copy of the task tracker, without listeners, that can
+        be read (e.g. exported) from another thread while this one changes.
+
+        Returns (TaskTracker): Copy of the task tracker.
+
+        """
+        with self.lock:
+            snapshot = TaskTracker()
+            snapshot._tasks = {name: task.copy() for name, task in self._tasks.items()}
+        return snapshot
 
     def create_and_add_task(self, task_name: str, currency_name: str) -> bool:
         """
@@ -43,10 +244,13 @@ class TaskTracker:
         """
         if not isinstance(task, Task):
             raise ValueError("Invalid task object.")
-        for t in self.tasks:
-            if t.name == task.name:
+        with self.lock:
+            if task.name in self._tasks:
                 return False
-        self.tasks.append(task)
+            self._tasks[task.name] = task
+            # exporting the task loads its history, only do it if needed
+            if self._listeners:
+                self._notify([{"op": "add", "task": task.export_to_dict()}])
         return True
 
     def remove_task(self, task_name: str) -> bool:
@@ -59,54 +263,430 @@ class TaskTracker:
         Returns (bool): Whether the task was removed.
 
         """
-        for task in self.tasks:
-            if task.name == task_name:
-                self.tasks.remove(task)
-                return True
-        return False
+        with self.lock:
+            if task_name not in self._tasks:
+                return False
+            del self._tasks[task_name]
+            self._notify([{"op": "remove", "name": task_name}])
+        return True
 
-    def increase_task_currency(self, task_name: str, step: int=1) -> bool:
+    def increase_task_currency(self,
+                               task_name: str,
+                               step: int=1,
+                               timestamp: Optional[datetime]=None) -> bool:
         """
         Increase the currency of a task by 'step' steps.
 
         Args:
             task_name (str): Name of the task.
             step (int): Amount of increase in task currency.
+            timestamp (Optional[datetime]): Time of the increase. Defaults to
+                now.
 
         Returns: Whether the task's currency was increased.
 
         """
-        for task in self.tasks:
-            if task.name == task_name:
-                task.increment(step)
-                return True
-        return False
+        with self.lock:
+            task = self._tasks.get(task_name)
+            if task is None:
+                return False
+            if timestamp is None:
+                timestamp = datetime.now()
+            task.increment(step, timestamp)
+            self._notify([{
+                "op": "increment",
+                "name": task_name,
+                "step": step,
+                "timestamp": timestamp.isoformat()
+            }])
+        return True
+
+    def rollup_task(self,
+                    task_name: str,
+                    raw_cutoff: int,
+                    daily_cutoff: int,
+                    since: Optional[int]=None) -> bool:
+        """
+        Roll up the history of a task (see 'app.rollup.rollup').
+
+        Args:
+            task_name (str): Name of the task.
+            raw_cutoff (int): Entries from here on are kept.
+            daily_cutoff (int): Entries from here on are kept per day, and
+                older ones per week.
+            since (Optional[int]): Entries before this are already rolled up.
+
+        Returns (bool): Whether any history entries were rolled up.
+
+        """
+        with self.lock:
+            task = self._tasks.get(task_name)
+            if task is None or not rollup_task(task, raw_cutoff, daily_cutoff, since):
+                return False
+            self._notify([{
+                "op": "rollup",
+                "name": task_name,
+                "raw_cutoff": raw_cutoff,
+                "daily_cutoff": daily_cutoff,
+                "since": since
+            }])
+        return True
+
+    def compact_history(self) -> int:
+        """
+        Roll up the loaded task histories according to the retention policy,
+        if any.
+
+        Returns (int): Number of task histories rolled up.
+
+        """
+        if self.retention is None:
+            return 0
+        with self.lock:
+            return self.retention.compact(self)
+
+    def progress(self, start: datetime, end: Optional[datetime]=None) -> Dict[str, int]:
+        """
+        Get the progress of every task in a time range, in a single pass (see
+        'Task.progress').
+
+        Args:
+            start (datetime): Start of the range, included.
+            end (Optional[datetime]): End of the range, excluded. Defaults to
+                no end.
+
+        Returns (Dict[str, int]): Progress of each task, by name.
+
+        """
+        with self.lock:
+            return {name: task.progress(start, end) for name, task in self._tasks.items()}
+
+    def average_per_day(self, days: float, now: Optional[datetime]=None) -> Dict[str, float]:
+        """
+        Get the average progress per day of every task over the last days, in
+        a single pass (see 'Task.average_per_day').
 
+        Args:
+            days (float): Number of days to average over, positive.
+            now (Optional[datetime]): End of the days. Defaults to now.
+
+        Returns (Dict[str, float]): Average progress per day of each task, by
+            name.
+
+        Raises:
+            ValueError: If 'days' is not positive.
+
+        """
+        if not days > 0:
+            raise ValueError("'days' must be positive!")
+        if now is None:
+            now = datetime.now()
+        start = now - timedelta(days=days)
+        with self.lock:
+            return {name: task.progress(start, now) / days for name, task in self._tasks.items()}
+
+    def longest_streaks(self) -> Dict[str, int]:
+        """
+        Get the longest streak of every task (see 'Task.longest_streak').
+
+        Returns (Dict[str, int]): Longest streak of each task in days, by name.
+
+        """
+        with self.lock:
+            return {name: task.longest_streak for name, task in self._tasks.items()}
+
+    def last_active(self) -> Dict[str, Optional[datetime]]:
+        """
+        Get the time of the newest history entry of every task, without loading
+        the histories where possible (see 'Task.last_active').
+
+        Returns (Dict[str, Optional[datetime]]): Time of the newest entry of
+            each task, by name, or None if its history is empty.
+
+        """
+        with self.lock:
+            return {name: task.last_active for name, task in self._tasks.items()}
+
+    def apply_record(self, record: dict) -> bool:
+        """
+        Apply a change record, as passed to listeners. Adding a task that
+        exists, or removing one that doesn't, is a no-op; increments are always
+        applied, since several can share a timestamp (see 'Journal.replay' for
+        skipping the records already applied).
+
+        Args:
+            record (dict): Change record to apply.
+
+        Returns (bool): Whether the task tracker was changed.
+
+        """
+        op = record["op"]
+        if op == "add":
+            return self.add_task(Task.import_from_dict(record["task"]))
+        if op == "remove":
+            return self.remove_task(record["name"])
+        if op == "increment":
+            return self.increase_task_currency(record["name"], record["step"],
+                                               datetime.fromisoformat(record["timestamp"]))
+        if op == "rollup":
+            return self.rollup_task(record["name"], record["raw_cutoff"],
+                                    record["daily_cutoff"], record.get("since"))
+        raise ValueError(f"Unknown record operation \"{op}\".")
+
+    def merge(self,
+              theirs: 'TaskTracker',
+              base: Optional['TaskTracker']=None,
+              changed: Optional[Set[str]]=None) -> List[str]:
+        """
+        Merge another version of the task tracker into this one, e.g. the one
+        another process saved. Task histories are merged entry by entry (see
+        'app.merge.merge_histories'), against the version both sides started
+        from, if known.
+
+        Tasks not in 'changed' take their version, or are removed if they
+        removed them. Tasks removed here stay removed, and tasks changed here
+        are kept even if they removed them.
+
+        Listeners are not notified: merged tasks are replaced, or their history
+        reset, and the merged state is meant to be saved right away (see
+        'Journal.compact').
+
+        Args:
+            theirs (TaskTracker): Their version of the task tracker.
+            base (Optional[TaskTracker]): Version both sides changed from, if
+                any.
+            changed (Optional[Set[str]]): Names of the tasks added, removed or
+                changed here since 'base'. Defaults to all of them.
+
+        Returns (List[str]): Names of the tasks added, removed or changed by
+            the merge.
+
+        """
+        base_tasks = base._tasks if base is not None else {}
+        with self.lock:
+            tasks = {}
+            merged = []
+            for name, task in self._tasks.items():
+                other = theirs._tasks.get(name)
+                if changed is not None and name not in changed:
+                    if other is not None:
+                        # new version, for values cached from the old one
+                        other.version = task.version + 1
+                        tasks[name] = other
+                    merged.append(name)
+                    continue
+
+                if other is not None:
+                    timestamps, totals, currency = merge_histories(task, other, base_tasks.get(name))
+                    if currency != task.currency or timestamps != task.timestamps or \
+                            totals != task.totals:
+                        task.timestamps, task.totals = timestamps, totals
+                        task.currency = currency
+                        merged.append(name)
+                tasks[name] = task
+
+            for name, other in theirs._tasks.items():
+                # skip the tasks removed here
+                if name in self._tasks or name in base_tasks or \
+                        (changed is not None and name in changed):
+                    continue
+                tasks[name] = other
+                merged.append(name)
+
+            self._tasks = tasks
+        return merged
+
+    @timed()
     def export_to_json(self, json_file_path: str) -> None:
         """
-        Export task tracker to json file.
+        Export task tracker to json file. The file is replaced atomically, so it
+        is never left truncated. Histories that are not loaded yet are copied
+        over without loading them.
 
         Args:
             json_file_path (str): Path to JSON file.
 
         """
-        with open(json_file_path, 'w') as file:
-            json.dump(
-                [task.export_to_dict() for task in self.tasks],
-                file, indent=2)
+        with self.lock, atomic_write(json_file_path) as file:
+            # same layout as json.dump(..., indent=2) of the exported tasks
+            file.write('[')
+            for i, task in enumerate(self._tasks.values()):
+                file.write(',\n  ' if i else '\n  ')
+
+                history = task.history_json_text()
+                if history is None:
+                    file.write(json.dumps(task.export_to_dict(), indent=2).replace('\n', '\n  '))
+                    continue
+
+                header = json.dumps({
+                    "name": task.name,
+                    "currency_name": task.currency_name,
+                    "currency": task.currency,
+                    "history": None
+                }, indent=2).replace('\n', '\n  ')
+                file.write(header[:-len('null\n  }')] + history + '\n  }')
+            file.write('\n]' if self._tasks else ']')
 
     @classmethod
-    def import_from_json(cls, json_file_path: str) -> 'TaskTracker':
+    @timed()
+    def import_from_json(cls, json_file_path: str, lazy: bool=False) -> 'TaskTracker':
         """
-        Import and create task tracker from json file.
+        Import and create task tracker from json file. An empty file holds no
+        tasks.
 
         Args:
             json_file_path (str): Path to JSON file.
+            lazy (bool): Whether to only read the task headers, and load each
+                task history from the (memory-mapped) file the first time it is
+                needed. Defaults to False.
 
         """
         tracker = cls()
+        if os.path.getsize(json_file_path) == 0:
+            return tracker
+
+        if lazy:
+            try:
+                tasks = load_lazy(json_file_path)
+            except (ValueError, KeyError):
+                # not laid out as expected, load it whole
+                pass
+            else:
+                for task in tasks:
+                    tracker.add_task(task)
+                return tracker
+
         with open(json_file_path, 'r') as file:
             data = json.load(file)
             for task in data:
                 tracker.add_task(Task.import_from_dict(task))
         return tracker
+
+    def export_to_binary(self, binary_file_path: str) -> None:
+        """
+        Export task tracker to a compact binary file (see 'app.binary_format').
+        The file is replaced atomically, so it is never left truncated.
+
+        Args:
+            binary_file_path (str): Path to binary file.
+
+        """
+        with self.lock, atomic_write(binary_file_path, 'wb') as file:
+            write_binary(list(self._tasks.values()), file)
+
+    @classmethod
+    def import_from_binary(cls, binary_file_path: str, lazy: bool=False) -> 'TaskTracker':
+        """
+        Import and create task tracker from a binary file.
+
+        Args:
+            binary_file_path (str): Path to binary file.
+            lazy (bool): Whether to decode each task history the first time it
+                is needed. Defaults to False.
+
+        """
+        tracker = cls()
+        for task in load_binary(binary_file_path, lazy):
+            tracker.add_task(task)
+        return tracker
+
+    def export_to_sqlite(self, db_file_path: str) -> None:
+        """
+        Export task tracker to a SQLite database file (see
+        'app.sqlite_store'). The file is replaced atomically.
+
+        Args:
+            db_file_path (str): Path to database file.
+
+        """
+        directory = os.path.dirname(os.path.abspath(db_file_path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(db_file_path),
+                                        suffix='.tmp', dir=directory)
+        os.close(fd)
+        try:
+            store = SQLiteStore(tmp_path)
+            with self.lock:
+                store.write(list(self._tasks.values()))
+            store.close()
+            os.replace(tmp_path, db_file_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def import_from_sqlite(cls, db_file_path: str, lazy: bool=False) -> 'TaskTracker':
+        """
+        Import and create task tracker from a SQLite database file. Histories
+        that are not loaded yet keep the database open.
+
+        Args:
+            db_file_path (str): Path to database file.
+            lazy (bool): Whether to load each task history the first time it is
+                needed. Defaults to False.
+
+        """
+        tracker = cls()
+        store = SQLiteStore(db_file_path)
+        for task in store.load(lazy):
+            tracker.add_task(task)
+        if not lazy:
+            store.close()
+        return tracker
+
+    @timed()
+    def export_to_file(self, file_path: str, save_format: str='json') -> None:
+        """
+        Export task tracker to a file.
+
+        Args:
+            file_path (str): Path to file.
+            save_format (str): One of 'SAVE_FORMATS'. Defaults to 'json'.
+
+        """
+        if save_format == 'json':
+            self.export_to_json(file_path)
+        elif save_format == 'binary':
+            self.export_to_binary(file_path)
+        elif save_format == 'sqlite':
+            self.export_to_sqlite(file_path)
+        else:
+            raise ValueError(f"Unknown save format \"{save_format}\".")
+
+    @classmethod
+    @timed()
+    def import_from_file(cls, file_path: str, lazy: bool=False) -> 'TaskTracker':
+        """
+        Import and create task tracker from a file, in any of the supported
+        formats (see 'detect_format').
+
+        Args:
+            file_path (str): Path to file.
+            lazy (bool): Whether to load each task history the first time it is
+                needed. Defaults to False.
+
+        """
+        save_format = detect_format(file_path)
+        if save_format == 'binary':
+            return cls.import_from_binary(file_path, lazy)
+        if save_format == 'sqlite':
+            return cls.import_from_sqlite(file_path, lazy)
+        return cls.import_from_json(file_path, lazy)
+
+
+def detect_format(file_path: str) -> str:
+    """
+    Detect the save format of a file. Missing or empty files are detected as
+    SQLite by their extension (see 'app.sqlite_store.SQLITE_EXTENSIONS'), and
+    as JSON otherwise.
+
+    Args:
+        file_path (str): Path to file.
+
+    Returns (str): One of 'SAVE_FORMATS'.
+
+    """
+    if is_sqlite(file_path):
+        return 'sqlite'
+    if os.path.exists(file_path) and is_binary(file_path):
+        return 'binary'
+    return 'json'
@@ -0,0 +1,84 @@
+"""
+Memory and increment latency of the task history, compared to the previous
+newest-first list of dicts representation.
+
+Run from the repository root:
+
+    python benchmarks/bench_history.py --sizes 100000 500000
+
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.task import Task
+
+
+def make_task(size: int) -> Task:
+    # one increment per minute, ending now
+    task = Task('bench')
+    start = datetime.now() - timedelta(minutes=size)
+    for i in range(size):
+        task.increment(1, start + timedelta(minutes=i))
+    return task
+
+
+def measure_memory(task: Task):
+    columnar = sys.getsizeof(task.timestamps) + sys.getsizeof(task.totals)
+
+    tracemalloc.start()
+    history = task.history
+    legacy, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del history
+
+    return columnar, legacy
+
+
+def measure_increment(task: Task, count: int):
+    # columnar history, appended in chronological order
+    start = time.perf_counter()
+    for _ in range(count):
+        task.increment(1)
+    columnar = (time.perf_counter() - start) / count
+
+    # previous representation, inserted at the front of a list
+    history = task.history
+    currency = task.currency
+    start = time.perf_counter()
+    for _ in range(count):
+        currency += 1
+        history.insert(0, {
+            "total_currency": currency,
+            "timestamp": datetime.now().isoformat()
+        })
+    legacy = (time.perf_counter() - start) / count
+
+    return columnar, legacy
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 500000],
+                        help='History sizes to measure.')
+    parser.add_argument('--increments', type=int, default=1000,
+                        help='Increments to average the latency over.')
+    args = parser.parse_args()
+
+    print(f"{'entries':>10} {'memory':>12} {'legacy memory':>14} "
+          f"{'increment':>12} {'legacy increment':>17}")
+    for size in args.sizes:
+        task = make_task(size)
+        memory, legacy_memory = measure_memory(task)
+        increment, legacy_increment = measure_increment(task, args.increments)
+        print(f"{size:>10} {memory / 2**20:>10.2f}MB {legacy_memory / 2**20:>12.2f}MB "
+              f"{increment * 1e6:>10.2f}us {legacy_increment * 1e6:>15.2f}us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Startup time of the data model imports, measured with 'python -X importtime'
+in fresh interpreters. Fails if the headless import path pulls in the
+plotting stack.
+
+Run from the repository root:
+
+    python benchmarks/bench_import.py --repeat 5
+
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules the data model must load without
+FORBIDDEN = ('matplotlib', 'PyQt5', 'mplcursors', 'sparklines')
+
+STATEMENTS = {
+    'headless': 'import app; app.TaskTracker',
+    'graph': 'import app; app.Graph',
+}
+
+
+def measure(statement: str):
+    # 'import time: self [us] | cumulative | imported package' lines on stderr
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+
+    total = 0
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        total += int(self_us)
+        modules.append(name.strip())
+    return total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Fresh interpreters to take the median over.')
+    args = parser.parse_args()
+
+    failed = False
+    for label, statement in STATEMENTS.items():
+        runs = [measure(statement) for _ in range(args.repeat)]
+        total = statistics.median(run[0] for run in runs)
+        modules = runs[-1][1]
+        print(f"{label:>10} {total / 1000:>8.1f}ms {len(modules):>5} modules  ({statement})")
+
+        if label == 'headless':
+            forbidden = sorted({name for name in modules
+                                if name.split('.')[0] in FORBIDDEN})
+            if forbidden:
+                print(f"headless import pulled in: {', '.join(forbidden)}")
+                failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
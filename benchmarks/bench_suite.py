@@ -0,0 +1,293 @@
+"""
+Benchmark suite of the data model, persistence and graph paths, on synthetic
+trackers of N tasks and M history entries in total. Results are written as
+JSON, to compare runs across commits, and can be checked against a baseline.
+
+Sizes are presets (small, medium, large) or TASKSxENTRIES, e.g. 500x200000.
+
+Run from the repository root:
+
+    python benchmarks/bench_suite.py --sizes small medium --output base.json
+    python benchmarks/bench_suite.py --sizes small medium --baseline base.json
+
+The second run fails if a benchmark got slower than the baseline by more than
+the threshold (see --threshold).
+
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# headless graph
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from app import Graph, Task, TaskTracker
+from app.task import to_timestamp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (tasks, history entries in total)
+SIZES = {
+    'small': (100, 10000),
+    'medium': (1000, 100000),
+    'large': (10000, 1000000),
+}
+
+BENCHMARKS = ('import_json', 'import_json_lazy', 'export_json', 'export_json_lazy',
+              'increment', 'increment_backdated', 'get_months', 'update_graph',
+              'update_graph_full', 'update_graph_changed', 'history_hover',
+              'history_hover_cached', 'progress')
+
+
+def parse_size(size: str):
+    if size in SIZES:
+        return SIZES[size]
+    try:
+        tasks, entries = size.lower().split('x')
+        return int(tasks), int(entries)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected one of {', '.join(SIZES)}, or TASKSxENTRIES.")
+
+
+def make_tracker(tasks: int, entries: int, span_days: float, seed: int=0) -> TaskTracker:
+    """
+    Synthetic tracker: 'entries' increments of 1 to 5 steps, spread unevenly
+    over 'tasks' tasks, at random times over the last 'span_days' days.
+
+    """
+    rng = random.Random(seed)
+    end = to_timestamp(datetime.now())
+    start = end - int(span_days * 86400 * 1000000)
+
+    # a few busy tasks, and a long tail of quiet ones
+    weights = [rng.random() ** 3 for _ in range(tasks)]
+    scale = entries / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    for i in rng.sample(range(tasks), entries - sum(counts)):
+        counts[i] += 1
+
+    tracker = TaskTracker()
+    for i, count in enumerate(counts):
+        task = Task(f'task {i}', 'steps')
+        task.timestamps = array('q', sorted(rng.randrange(start, end) for _ in range(count)))
+        totals = array('q')
+        total = 0
+        for _ in range(count):
+            total += rng.randint(1, 5)
+            totals.append(total)
+        task.totals = totals
+        task.currency = total
+        tracker.add_task(task)
+    return tracker
+
+
+def make_graph() -> Graph:
+    graph = Graph()
+    graph.set_color_scheme(figure_color=(1.0, 1.0, 1.0), text_color=(0.0, 0.0, 0.0),
+                           bar_color=(0.2, 0.4, 0.6))
+    return graph
+
+
+def measure(run, repeat: int, setup=None, ops: int=1) -> dict:
+    # 'setup' is not timed, and its result is passed to 'run'
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    return {"ops": ops, "min": min(times), "median": statistics.median(times),
+            "per_op": min(times) / ops}
+
+
+def run_size(tasks: int, entries: int, args, benchmarks) -> dict:
+    tracker = make_tracker(tasks, entries, args.span_days, args.seed)
+    directory = tempfile.mkdtemp()
+    save_file = os.path.join(directory, 'tracker.json')
+    export_file = os.path.join(directory, 'export.json')
+    tracker.export_to_json(save_file)
+
+    now = datetime.now()
+    # the tasks with the longest histories, the ones hovered the most
+    hovered = sorted(tracker.tasks, key=lambda task: -len(task.timestamps))[:args.hover_tasks]
+
+    def increment(snapshot):
+        task_list = snapshot.tasks
+        for i in range(args.increments):
+            task_list[i % len(task_list)].increment(1, now + timedelta(microseconds=i))
+
+    def increment_backdated(snapshot):
+        # into the middle of the histories
+        middle = now - timedelta(days=args.span_days / 2)
+        task_list = snapshot.tasks
+        for i in range(args.increments):
+            task_list[i % len(task_list)].increment(1, middle - timedelta(microseconds=i))
+
+    def built_graph():
+        graph = make_graph()
+        graph.update_graph(tracker.tasks)
+        return graph
+
+    def changed_graph():
+        snapshot = tracker.snapshot()
+        graph = make_graph()
+        graph.update_graph(snapshot.tasks)
+        return graph, snapshot
+
+    def update_changed(state):
+        graph, snapshot = state
+        task_list = snapshot.tasks
+        for i in range(args.increments):
+            task = task_list[i % len(task_list)]
+            task.increment(1, now)
+            graph.update_graph(task_list, changed=[task.name])
+
+    def hover(graph):
+        graph._hover_cache.clear()
+        for task in hovered:
+            graph.get_history_hover(task)
+
+    def hover_cached(graph):
+        for task in hovered:
+            graph.get_history_hover(task)
+
+    def hover_graph():
+        graph = make_graph()
+        hover_cached(graph)
+        return graph
+
+    cases = {
+        'import_json': lambda: measure(lambda _: TaskTracker.import_from_json(save_file), args.repeat),
+        'import_json_lazy': lambda: measure(
+            lambda _: TaskTracker.import_from_json(save_file, lazy=True), args.repeat),
+        'export_json': lambda: measure(lambda _: tracker.export_to_json(export_file), args.repeat),
+        'export_json_lazy': lambda: measure(
+            lambda lazy: lazy.export_to_json(export_file), args.repeat,
+            setup=lambda: TaskTracker.import_from_json(save_file, lazy=True)),
+        'increment': lambda: measure(increment, args.repeat, setup=tracker.snapshot,
+                                     ops=args.increments),
+        'increment_backdated': lambda: measure(increment_backdated, args.repeat,
+                                               setup=tracker.snapshot, ops=args.increments),
+        'get_months': lambda: measure(lambda graph: graph.get_months(tracker.tasks), args.repeat,
+                                      setup=make_graph),
+        # first update, adding every row
+        'update_graph': lambda: measure(lambda graph: graph.update_graph(tracker.tasks),
+                                        args.repeat, setup=make_graph),
+        # periodic full recompute of existing rows
+        'update_graph_full': lambda: measure(lambda graph: graph.update_graph(tracker.tasks),
+                                             args.repeat, setup=built_graph),
+        'update_graph_changed': lambda: measure(update_changed, args.repeat, setup=changed_graph,
+                                                ops=args.increments),
+        'history_hover': lambda: measure(hover, args.repeat, setup=make_graph, ops=len(hovered)),
+        'history_hover_cached': lambda: measure(hover_cached, args.repeat, setup=hover_graph,
+                                                ops=len(hovered)),
+        # range query over every task, e.g. the last month
+        'progress': lambda: measure(
+            lambda _: tracker.progress(now - timedelta(days=30), now), args.repeat, ops=tasks),
+    }
+
+    results = {}
+    for name in benchmarks:
+        results[name] = cases[name]()
+        plt.close('all')
+        print(f"{tasks}x{entries} {name:<22} {results[name]['min'] * 1000:>10.2f}ms"
+              f"{results[name]['per_op'] * 1e6:>12.2f}us/op", file=sys.stderr)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> int:
+    """
+    Print the change of every benchmark against the baseline.
+
+    Returns (int): Number of benchmarks slower than the baseline by more than
+        'threshold'.
+
+    """
+    regressions = 0
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        ratio = result['per_op'] / base['per_op']
+        regressed = ratio > 1 + threshold
+        regressions += regressed
+        print(f"{key:<36} {base['per_op'] * 1e6:>12.2f}us {result['per_op'] * 1e6:>12.2f}us "
+              f"{(ratio - 1) * 100:>+8.1f}%{'  REGRESSION' if regressed else ''}", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[SIZES['small'], SIZES['medium']],
+                        help='Sizes to run: small, medium, large, or TASKSxENTRIES. '
+                        'Defaults to small and medium.')
+    parser.add_argument('--span-days', type=float, default=365,
+                        help='Days the histories are spread over. Defaults to 365.')
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARKS, default=BENCHMARKS,
+                        metavar='NAME', help='Benchmarks to run: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs of each benchmark, the fastest is kept. Defaults to 3.')
+    parser.add_argument('--increments', type=int, default=1000,
+                        help='Increments timed by the increment benchmarks.')
+    parser.add_argument('--hover-tasks', type=int, default=50,
+                        help='Tasks whose tooltips are timed.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='File to write the results to, as JSON. '
+                        'Defaults to stdout.')
+    parser.add_argument('--baseline', help='Results of a previous run to compare to.')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Slowdown over the baseline counted as a regression, '
+                        'as a fraction. Defaults to 0.25.')
+    args = parser.parse_args()
+
+    results = {}
+    for tasks, entries in args.sizes:
+        for name, result in run_size(tasks, entries, args, args.benchmarks).items():
+            results[f'{tasks}x{entries}/{name}'] = result
+
+    report = {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "span_days": args.span_days,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"{regressions} regressions over {args.threshold:.0%}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
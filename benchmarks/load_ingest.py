@@ -0,0 +1,116 @@
+"""
+Load generator for the HTTP ingestion endpoint: concurrent keep-alive
+clients POST batches of increments, and the sustained events/sec and the
+request latency percentiles are reported.
+
+Without --port, an endpoint is started in-process on a fresh journaled
+tracker in a temporary directory.
+
+Run from the repository root:
+
+    python benchmarks/load_ingest.py --clients 8 --requests 2000 --batch 10
+    python benchmarks/load_ingest.py --wait    # latency until applied and saved
+
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import Journal, TaskTracker
+from app.ingest import IngestServer
+
+
+async def client(host: str, port: int, requests: int, body: bytes, path: str,
+                 latencies: list) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    request = (f'POST {path} HTTP/1.1\r\nHost: {host}\r\n'
+               f'Content-Type: application/json\r\n'
+               f'Content-Length: {len(body)}\r\n\r\n').encode() + body
+    try:
+        for _ in range(requests):
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+
+            status = await reader.readline()
+            length = 0
+            while (line := await reader.readline()) not in (b'\r\n', b''):
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+
+            if b' 20' not in status:
+                raise RuntimeError(f'Request failed: {status.decode().strip()}')
+    finally:
+        writer.close()
+
+
+async def run(args, host: str, port: int):
+    events = [{"task": f'task{i % args.tasks}', "step": 1} for i in range(args.batch)]
+    body = json.dumps(events).encode()
+    path = '/events?wait=1' if args.wait else '/events'
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, args.requests, body, path, latencies)
+                           for _ in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    return elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int,
+                        help='Port of a running endpoint. Defaults to starting one.')
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent connections.')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per client.')
+    parser.add_argument('--batch', type=int, default=10, help='Events per request.')
+    parser.add_argument('--tasks', type=int, default=100,
+                        help='Tasks the events are spread over (task0, task1, ...).')
+    parser.add_argument('--wait', action='store_true',
+                        help='Wait for the events to be applied before each reply.')
+    args = parser.parse_args()
+
+    server = None
+    if args.port is None:
+        directory = tempfile.mkdtemp()
+        save_file = os.path.join(directory, 'tracker.json')
+        tracker = TaskTracker()
+        for i in range(args.tasks):
+            tracker.create_and_add_task(f'task{i}', 'steps')
+        tracker.export_to_json(save_file)
+        journal = Journal(tracker, save_file, compact_threshold=10**9)
+        journal.attach()
+
+        server = IngestServer(tracker, port=0)
+        server.start_thread()
+        port = server.port
+    else:
+        port = args.port
+
+    elapsed, latencies = asyncio.run(run(args, '127.0.0.1', port))
+
+    if server is not None:
+        server.stop_thread()
+        journal.close()
+        print(f"applied {server.applied} events in {server.batches} batches")
+
+    latencies.sort()
+    total = len(latencies) * args.batch
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{total} events in {elapsed:.2f}s: {total / elapsed:,.0f} events/s, "
+          f"{len(latencies) / elapsed:,.0f} requests/s")
+    print(f"latency p50 {statistics.median(latencies) * 1000:.2f}ms, "
+          f"p99 {p99 * 1000:.2f}ms, max {latencies[-1] * 1000:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
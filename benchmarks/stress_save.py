@@ -0,0 +1,120 @@
+"""
+Stress test of concurrent writers: several processes increment the same tasks
+of one save file in parallel, each journaling and compacting it on its own,
+and the saved totals are checked against the increments made.
+
+Each process uses distinct microseconds, as distinct clients do in practice,
+but increments within a process can share a timestamp (see --duplicates), as
+batches of increments with a given time do.
+
+Run from the repository root:
+
+    python benchmarks/stress_save.py --processes 4 --increments 2000
+
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import Journal, TaskTracker
+from app.filelock import FileLock, lock_path
+
+
+def worker(save_file: str, index: int, processes: int, increments: int,
+           tasks: int, compact_threshold: int, duplicates: float, seed: int) -> dict:
+    rng = random.Random(seed + index)
+
+    lock = FileLock(lock_path(save_file))
+    with lock.locked(exclusive=False):
+        tracker = TaskTracker.import_from_file(save_file, lazy=True)
+        journal = Journal(tracker, save_file, compact_threshold=compact_threshold)
+        journal.replay()
+        journal.attach()
+    lock.close()
+
+    counts = {}
+    last = None
+    for _ in range(increments):
+        if last is not None and rng.random() < duplicates:
+            # same timestamp as the previous increment
+            now = last
+        else:
+            # distinct microseconds per process, increasing within it
+            now = datetime.now()
+            now -= timedelta(microseconds=now.microsecond % processes - index)
+            if last is not None and now <= last:
+                now = last + timedelta(microseconds=processes)
+        last = now
+
+        name = f'task{rng.randrange(tasks)}'
+        step = rng.randint(1, 5)
+        tracker.increase_task_currency(name, step, now)
+        counts[name] = counts.get(name, 0) + step
+
+        if rng.random() < 0.01:
+            journal.compact()
+    journal.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--increments', type=int, default=2000, help='Increments per process.')
+    parser.add_argument('--tasks', type=int, default=5, help='Tasks shared by the processes.')
+    parser.add_argument('--compact-threshold', type=int, default=50,
+                        help='Journal records after which a process compacts.')
+    parser.add_argument('--duplicates', type=float, default=0.1,
+                        help='Fraction of increments reusing the timestamp of the previous '
+                        'one of their process. Defaults to 0.1.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    save_file = os.path.join(tempfile.mkdtemp(), 'tracker.json')
+    tracker = TaskTracker()
+    for i in range(args.tasks):
+        tracker.create_and_add_task(f'task{i}', 'steps')
+    tracker.export_to_json(save_file)
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.processes) as pool:
+        results = pool.starmap(worker, [
+            (save_file, i, args.processes, args.increments, args.tasks,
+             args.compact_threshold, args.duplicates, args.seed) for i in range(args.processes)])
+    elapsed = time.perf_counter() - start
+
+    expected = {}
+    for counts in results:
+        for name, count in counts.items():
+            expected[name] = expected.get(name, 0) + count
+
+    saved = TaskTracker.import_from_file(save_file)
+    journal = Journal(saved, save_file)
+    journal.replay()
+
+    lost = 0
+    for name, count in sorted(expected.items()):
+        task = saved.get_task(name)
+        total = task.totals[-1] if task.totals else 0
+        if task.currency != count or total != count:
+            lost += count - task.currency
+            print(f'{name}: expected {count}, saved {task.currency} (history total {total})')
+
+    increments = args.processes * args.increments
+    print(f'{increments} increments from {args.processes} processes in {elapsed:.2f}s, '
+          f'{journal.size} records left in the journal')
+    if lost:
+        print(f'FAILED: {lost} steps lost')
+        sys.exit(1)
+    print('no lost updates')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,22 @@
 import os
 import sys
 import argparse
-from functools import partial
+import asyncio
+from datetime import datetime
 
-from PyQt5.QtWidgets import QApplication
-
-from app import TaskTracker
-from ui import TaskTrackerUI
+from app import (
+    SAVE_FORMATS,
+    AutoSaver,
+    Journal,
+    RetentionPolicy,
+    SQLiteStore,
+    TaskTracker,
+    detect_format,
+)
+from app import profiling
+from app.filelock import FileLock, lock_path
+from app.ingest import IngestServer
+from app.ipc import RequestError, encode_op, handle_request, send_request, socket_path
 
 
 def get_local_save_file(file_name='tracker.json'):
@@ -25,26 +35,374 @@ def get_local_save_file(file_name='tracker.json'):
     return save_file
 
 
+def convert_save_file(source, destination, save_format):
+    # keep other processes from saving the source while it is converted
+    lock = FileLock(lock_path(source))
+    try:
+        with lock.locked():
+            # load the source with its pending journal, and save it in the new
+            # format; detected first, since converting in place replaces it
+            source_format = detect_format(source)
+            tracker = TaskTracker.import_from_file(source)
+            journal = None
+            if source_format != 'sqlite':
+                journal = Journal(tracker, source)
+                journal.replay()
+            tracker.export_to_file(destination, save_format)
+
+            # the journal is folded into the converted file
+            if journal is not None and os.path.abspath(source) == os.path.abspath(destination):
+                for path in (journal.journal_file, journal.folded_file):
+                    if os.path.exists(path):
+                        os.remove(path)
+    finally:
+        lock.close()
+
+
+def open_tracker(save_file, save_format, compact_threshold):
+    """
+    Load the tracker from its save file, and start persisting its changes.
+
+    Returns: The tracker, and its SQLite store or journal.
+
+    """
+    if save_format == 'sqlite':
+        # every change is written to the database as it happens, and task
+        # histories are loaded from it as they are needed
+        store = SQLiteStore(save_file)
+        tracker = TaskTracker()
+        for task in store.load(lazy=True):
+            tracker.add_task(task)
+        store.attach(tracker)
+        return tracker, store
+
+    # don't load a snapshot and journal another process is compacting
+    lock = FileLock(lock_path(save_file))
+    with lock.locked(exclusive=False):
+        # task histories are loaded from the file as they are needed
+        tracker = TaskTracker.import_from_file(save_file, lazy=True)
+
+        # replay changes since the last snapshot, and journal new ones
+        journal = Journal(tracker, save_file,
+                          compact_threshold=compact_threshold,
+                          save_format=save_format)
+        journal.replay()
+        journal.attach()
+    lock.close()
+    return tracker, journal
+
+
+def read_increments(lines):
+    """
+    Parse increments, one per line: the task name, then optionally the step
+    and an ISO format timestamp, separated by tabs.
+
+    Returns: List of (task name, step, timestamp or None).
+
+    Raises:
+        ValueError: If a line can't be parsed.
+
+    """
+    increments = []
+    for number, line in enumerate(lines, start=1):
+        line = line.rstrip('\n')
+        if not line.strip():
+            continue
+        fields = line.split('\t')
+        if len(fields) > 3:
+            raise ValueError(f'line {number}: expected at most 3 tab separated fields')
+        try:
+            step = int(fields[1]) if len(fields) > 1 else 1
+            timestamp = datetime.fromisoformat(fields[2]) if len(fields) > 2 else None
+        except ValueError as error:
+            raise ValueError(f'line {number}: {error}') from None
+        increments.append((fields[0], step, timestamp))
+    return increments
+
+
+def command_request(args):
+    """
+    Build the request running a subcommand (see 'app.ipc'), or the request
+    showing the running GUI if there is no subcommand.
+
+    Returns: The request.
+
+    Raises:
+        ValueError: If the subcommand arguments are invalid.
+
+    """
+    if args.command is None:
+        return {"command": "show"}
+    if args.command == 'serve':
+        return None
+
+    if args.command == 'add':
+        ops = [("add", args.name, args.currency_name)]
+    elif args.command == 'remove':
+        ops = [("remove", args.name)]
+    elif args.command == 'inc':
+        if args.task is None:
+            increments = read_increments(sys.stdin)
+        else:
+            increments = [(args.task, args.step, args.at)]
+        if any(step < 1 for _, step, _ in increments):
+            raise ValueError("Can't increment with negative or zero steps!")
+        # applied all at once, so saved in a single journal write or transaction
+        ops = [("increment", name, step, timestamp) for name, step, timestamp in increments]
+    elif args.command == 'list':
+        return {"command": "list"}
+    else:
+        # the running instance may not share our working directory
+        return {"command": "export", "path": os.path.abspath(args.destination),
+                "format": args.format}
+
+    return {"command": "batch", "ops": [encode_op(op) for op in ops]}
+
+
+def print_reply(reply):
+    """
+    Print the reply to a subcommand request.
+
+    Returns: Exit status.
+
+    """
+    if not reply["ok"]:
+        print(reply["error"], file=sys.stderr)
+        return 1
+    for name, currency, currency_name in reply.get("tasks", ()):
+        print(f'{name}\t{currency}\t{currency_name}')
+    return 0
+
+
+def run_serve(tracker, storage, args):
+    """
+    Ingest progress events over HTTP until interrupted.
+
+    Returns: Exit status.
+
+    """
+    server = IngestServer(tracker, port=args.port, max_queue=args.max_queue,
+                          max_batch=args.max_batch, max_delay=args.max_delay)
+    print(f'Listening on http://{server.host}:{server.port}/events', file=sys.stderr)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    except OSError as error:
+        print(f'Can\'t listen: {error}', file=sys.stderr)
+        return 1
+    finally:
+        close_storage(storage)
+    return 0
+
+
+def close_storage(storage):
+    # changes are already in the database or the journal, the journal is
+    # folded into the save file once it grows past the threshold
+    if isinstance(storage, SQLiteStore):
+        storage.close()
+    else:
+        storage.detach()
+
+
+def run_gui(tracker, storage, save_file, autosave, autosave_max_pending, http_port):
+    # Qt is only needed, and imported, for the GUI
+    from PyQt5.QtCore import QTimer
+    from PyQt5.QtWidgets import QApplication
+    from ui import TaskTrackerUI, TrackerServer
+
+    # construct the Qt app
+    app = QApplication(sys.argv)
+
+    if profiling.enabled():
+        # wake Python up regularly, so that the profiling signals are handled
+        # while Qt waits for events
+        wake_timer = QTimer()
+        wake_timer.timeout.connect(lambda: None)
+        wake_timer.start(250)
+
+    # construct the main view
+    tracker_app = TaskTrackerUI(tracker, app)
+
+    # run commands from later launches and other local tools, the graph is
+    # refreshed from the tracker changes
+    server = TrackerServer(tracker, socket_path(save_file))
+    if server.listen():
+        server.show_requested.connect(tracker_app.show_window)
+        app.aboutToQuit.connect(server.close)
+    else:
+        print(f'Not listening for commands: {server.server.errorString()}', file=sys.stderr)
+
+    # ingest events over HTTP in a background thread, the graph is refreshed
+    # in the GUI thread
+    if http_port is not None:
+        ingest = IngestServer(tracker, port=http_port)
+        try:
+            ingest.start_thread()
+        except OSError as error:
+            print(f'Not ingesting events over HTTP: {error}', file=sys.stderr)
+        else:
+            app.aboutToQuit.connect(ingest.stop_thread)
+
+    # connected last, so the servers above stop changing the tracker first
+    if isinstance(storage, SQLiteStore):
+        app.aboutToQuit.connect(tracker.compact_history)
+        app.aboutToQuit.connect(storage.close)
+    else:
+        # show the changes of other processes merged when saving
+        storage.on_merge = tracker_app.tasks_merged.emit
+
+        # fold the journal into the save file in the background, after the
+        # changes settle if autosaving, and once it grows past the threshold
+        autosaver = AutoSaver(tracker, storage.compact,
+                              interval=autosave or None,
+                              max_pending=autosave_max_pending if autosave else None)
+        storage.on_full = autosaver.save_soon
+        autosaver.start()
+        app.aboutToQuit.connect(autosaver.close)
+        app.aboutToQuit.connect(storage.close)
+
+    return app.exec_()
+
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--save-file', help='Tracker json file.', type=str)
+    parser.add_argument('--save-file', help='Tracker save file.', type=str)
+    parser.add_argument('--save-format', choices=SAVE_FORMATS,
+                        help='Format to save the tracker in. Defaults to the '
+                        'format of the save file, or, for a new one, sqlite '
+                        'for .db files and json otherwise.')
+    parser.add_argument('--migrate-from', metavar='FILE',
+                        help='Create the save file from another save file, in '
+                        'any format (e.g. tracker.json to tracker.db).')
+    parser.add_argument('--compact-threshold', type=int, default=1000,
+                        help='Number of journaled changes after which the '
+                        'journal is folded into the save file.')
+    parser.add_argument('--autosave', type=float, metavar='SECONDS',
+                        help='Save the tracker in the background, this many '
+                        'seconds after the last change.')
+    parser.add_argument('--autosave-max-pending', type=int, metavar='CHANGES',
+                        help='Save right away once this many changes are '
+                        'unsaved (requires --autosave).')
+    parser.add_argument('--http-port', type=int, metavar='PORT',
+                        help='Also ingest progress events POSTed as JSON to '
+                        'http://127.0.0.1:PORT/events while the GUI runs.')
+    parser.add_argument('--retain-raw-days', type=int, metavar='DAYS',
+                        help='Roll up history older than this many days into '
+                        'one entry per day.')
+    parser.add_argument('--retain-daily-days', type=int, default=365, metavar='DAYS',
+                        help='Roll up history older than this many days into '
+                        'one entry per week (requires --retain-raw-days).')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='Time loading, saving and graph updates, and write '
+                        'the timings to FILE at exit, or on SIGUSR1.')
+    parser.add_argument('--profile-capture', choices=profiling.CAPTURE_KINDS,
+                        help='Also capture the first graph refresh, and the '
+                        'next one on SIGUSR2, with cProfile or tracemalloc '
+                        '(implies --profile).')
+
+    # headless subcommands, without them the GUI is started
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    add_parser = commands.add_parser('add', help='Add a task.')
+    add_parser.add_argument('name', help='Name of the task.')
+    add_parser.add_argument('--currency-name', default='steps',
+                            help='Currency name of the task. Defaults to steps.')
+
+    remove_parser = commands.add_parser('remove', help='Remove a task.')
+    remove_parser.add_argument('name', help='Name of the task.')
+
+    inc_parser = commands.add_parser(
+        'inc', help='Increment a task.',
+        description='Increment a task, or, without a task name, every task '
+        'read from stdin: one per line, as the task name, optionally followed '
+        'by the step and an ISO format timestamp, separated by tabs.')
+    inc_parser.add_argument('task', nargs='?', help='Name of the task.')
+    inc_parser.add_argument('step', nargs='?', type=int, default=1,
+                            help='Increment by these many steps. Defaults to 1.')
+    inc_parser.add_argument('--at', type=datetime.fromisoformat, metavar='TIMESTAMP',
+                            help='ISO format time of the increment. Defaults to now.')
+
+    commands.add_parser('list', help='List the tasks, as tab separated name, '
+                        'currency and currency name.')
+
+    export_parser = commands.add_parser('export', help='Export the tracker to another file.')
+    export_parser.add_argument('destination', help='File to export to.')
+    export_parser.add_argument('--format', choices=SAVE_FORMATS,
+                               help='Format to export in. Defaults to the '
+                               'format of the destination file.')
+
+    serve_parser = commands.add_parser(
+        'serve', help='Ingest progress events over HTTP, without the GUI.',
+        description='Ingest progress events POSTed as JSON to '
+        'http://127.0.0.1:PORT/events, until interrupted.')
+    serve_parser.add_argument('--port', type=int, default=8765,
+                              help='Port to listen on. Defaults to 8765.')
+    serve_parser.add_argument('--max-queue', type=int, default=100000,
+                              help='Events queued before requests wait.')
+    serve_parser.add_argument('--max-batch', type=int, default=5000,
+                              help='Events applied and saved at once.')
+    serve_parser.add_argument('--max-delay', type=float, default=0.05, metavar='SECONDS',
+                              help='Time a batch waits for more events.')
 
     args = parser.parse_args()
 
-    # construct the Qt app
-    app = QApplication(sys.argv)
+    if args.profile or args.profile_capture:
+        profiling.enable(args.profile, args.profile_capture)
 
     # open tracker file and import tasks
     if (save_file := args.save_file) is None:
         save_file = get_local_save_file()
-    tracker = TaskTracker.import_from_json(save_file)
+    elif not os.path.exists(save_file):
+        # start a new tracker, like with the default save file
+        open(save_file, 'a').close()
+    save_format = args.save_format or detect_format(save_file)
 
-    # construct the main view
-    tracker_app = TaskTrackerUI(tracker, app)
+    try:
+        request = command_request(args)
+    except ValueError as error:
+        print(f'Invalid command, {error}', file=sys.stderr)
+        sys.exit(1)
+
+    # forward the command to the instance already running on the save file,
+    # if any, instead of racing it on the save file
+    if request is not None and not args.migrate_from and save_format == detect_format(save_file):
+        try:
+            reply = send_request(socket_path(save_file), request)
+        except RequestError as error:
+            # the request may have run, don't run it on the save file too
+            print(f'Request failed: {error}', file=sys.stderr)
+            sys.exit(1)
+        if reply is not None:
+            sys.exit(print_reply(reply))
+
+    # one-shot migration from another save file
+    if args.migrate_from:
+        if os.path.exists(save_file) and os.path.getsize(save_file) > 0:
+            parser.error(f'save file "{save_file}" already exists, not migrating')
+        convert_save_file(args.migrate_from, save_file, save_format)
+
+    # convert the save file right away if asked for another format
+    elif save_format != detect_format(save_file):
+        convert_save_file(save_file, save_file, save_format)
+
+    tracker, storage = open_tracker(save_file, save_format, args.compact_threshold)
+
+    # roll up old history when saving (or, for sqlite, on quit)
+    if args.retain_raw_days is not None:
+        tracker.retention = RetentionPolicy(args.retain_raw_days, args.retain_daily_days)
 
-    app.aboutToQuit.connect(partial(tracker.export_to_json, save_file))
+    if args.command is None:
+        sys.exit(run_gui(tracker, storage, save_file, args.autosave,
+                         args.autosave_max_pending, args.http_port))
+    if args.command == 'serve':
+        sys.exit(run_serve(tracker, storage, args))
 
-    sys.exit(app.exec_())
+    try:
+        status = print_reply(handle_request(tracker, request))
+    finally:
+        close_storage(storage)
+    sys.exit(status)
 
 
 if __name__ == '__main__':
@@ -1 +1,2 @@
 from .tracker_ui import TaskTrackerUI
+from .ipc_server import TrackerServer
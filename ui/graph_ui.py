@@ -1,24 +1,67 @@
-from typing import List
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, List, Optional
 
+from PyQt5.QtCore import QEvent, Qt, pyqtSignal
 from PyQt5.QtWidgets import (
+    QComboBox,
+    QHBoxLayout,
+    QLabel,
+    QScrollBar,
     QWidget,
     QVBoxLayout
 )
 
-from app import Graph
+from app import ActivityIndex, Graph, TaskTracker, profiling
 from app.task import Task
 
+# tasks shown: label, number of tasks (None for all), and whether they are
+# ordered by recent activity rather than by when they were added
+SHOWN_TASKS = (
+    ("All tasks", None, False),
+    ("All tasks, most recent first", None, True),
+    ("10 most recent", 10, True),
+    ("25 most recent", 25, True),
+    ("100 most recent", 100, True),
+)
+
 
 class GraphUI(QWidget):
-    def __init__(self):
+    # graph updates prepared on the worker thread, with their generation
+    _prepared = pyqtSignal(object, object)
+
+    def __init__(self, tracker: TaskTracker):
         """
-        Main Graph UI interface.
+        Main Graph UI interface. Only the rows that fit the canvas are graphed,
+        the others are scrolled to.
+
+        Args:
+            tracker (TaskTracker): Task tracker to graph.
 
         """
         super().__init__()
 
+        self.tracker = tracker
         self.graph = Graph()
 
+        # tasks by recent activity, kept up to date on every change
+        self.index = ActivityIndex(tracker)
+        self.index.attach()
+
+        # minimum height of a row, in pixels, and the number of rows that fit
+        self.row_height = 28
+        self.visible_rows = 1
+
+        # graph updates are prepared on a worker thread, from copies of the
+        # tasks of the recomputed rows, and only the latest one is applied;
+        # the changes of the dropped ones are prepared again, None for all
+        # tasks
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='graph-prepare')
+        self.generation = 0
+        self._future = None
+        self._unapplied = set()
+        self._prepared.connect(self._apply_prepared)
+
         self.init_ui()
 
     def init_ui(self):
@@ -36,22 +79,147 @@ class GraphUI(QWidget):
 
         # get plot canvas
         self.canvas = self.graph.get_canvas()
+        profiling.instrument(self.canvas, 'draw', 'canvas.draw')
+
+        # choice of tasks shown
+        self.shown_combobox = QComboBox(self)
+        for label, _, _ in SHOWN_TASKS:
+            self.shown_combobox.addItem(label)
+
+        # rows outside the canvas are scrolled to, newest first
+        self.scrollbar = QScrollBar(Qt.Vertical, self)
+        self.scrollbar.setRange(0, 0)
 
         # create widgets and embed plot in PyQt
+        top = QHBoxLayout()
+        top.addWidget(QLabel("Show:", self))
+        top.addWidget(self.shown_combobox)
+        top.addStretch()
+
+        graph = QHBoxLayout()
+        graph.addWidget(self.canvas)
+        graph.addWidget(self.scrollbar)
+
         vbox = QVBoxLayout()
-        vbox.addWidget(self.canvas)
+        vbox.addLayout(top)
+        vbox.addLayout(graph)
 
         self.setLayout(vbox)
 
+        self.shown_combobox.currentIndexChanged.connect(self._shown_changed)
+        self.scrollbar.valueChanged.connect(lambda _: self.refresh_data(changed=()))
+        self.canvas.mpl_connect('scroll_event', self._on_scroll)
+        # the rows that fit follow the canvas size
+        self.canvas.installEventFilter(self)
+
         self.show()
 
-    def refresh_data(self, tasks: List[Task]):
+    @profiling.timed()
+    def refresh_data(self, changed: Optional[Iterable[str]]=None):
         """
-        Refresh graph data.
+        Refresh graph data. The graph is updated once the data is prepared on
+        the worker thread, unless another refresh comes first.
 
         Args:
-            tasks (List[Task]): List of tasks to update in the graph.
+            changed (Optional[Iterable[str]]): Names of the tasks changed since
+                the last refresh. Defaults to all.
+
+        """
+        if changed is None:
+            self.index.rebuild()
+            self._unapplied = None
+        else:
+            # also catches up with the changes that are not notified, e.g. merges
+            changed = list(changed)
+            self.index.refresh(changed)
+            if self._unapplied is not None:
+                self._unapplied.update(changed)
+
+        # the previous update is stale, drop it if it is not prepared yet
+        if self._future is not None:
+            self._future.cancel()
+        self.generation += 1
+        generation = self.generation
+
+        tasks = self.visible_tasks()
+        unapplied = None if self._unapplied is None else set(self._unapplied)
+        # the other rows are only read for their names
+        stale = self.graph.stale_rows([task.name for task in tasks], unapplied)
+        with self.tracker.lock:
+            for i in stale[0]:
+                tasks[i] = tasks[i].copy()
+        self._future = self.executor.submit(self.graph.prepare, tasks, unapplied, stale)
+        # posted back to the GUI thread
+        self._future.add_done_callback(lambda future: self._prepared.emit(generation, future))
+
+    def _apply_prepared(self, generation: int, future: Future):
+        if generation != self.generation or future.cancelled():
+            return
+        self._future = None
+        try:
+            update = future.result()
+        except Exception:
+            traceback.print_exc()
+            return
+        self._unapplied = set()
+
+        # keep the histories loaded by the copies, and graph the tasks
+        # themselves, whose tooltips stay cached across refreshes
+        with self.tracker.lock:
+            originals = []
+            for task in update.tasks:
+                original = self.tracker.get_task(task.name)
+                if original is not None:
+                    original.adopt_history(task)
+                originals.append(original or task)
+            update.tasks = originals
+
+        self.graph.apply(update)
+        self.canvas.draw_idle()
+
+    def visible_tasks(self) -> List[Task]:
+        """
+        Get the tasks in the visible rows, bottom row first, and update the
+        scroll range to the tasks shown.
+
+        Returns (List[Task]): Tasks to graph.
 
         """
-        self.graph.update_graph(tasks)
-        self.canvas.draw()
+        _, top, by_activity = SHOWN_TASKS[self.shown_combobox.currentIndex()]
+        with self.tracker.lock:
+            shown = len(self.index) if top is None else min(top, len(self.index))
+
+            self.scrollbar.blockSignals(True)
+            self.scrollbar.setRange(0, max(shown - self.visible_rows, 0))
+            self.scrollbar.setPageStep(self.visible_rows)
+            self.scrollbar.blockSignals(False)
+            start = self.scrollbar.value()
+            count = min(self.visible_rows, shown - start)
+
+            # the first shown task is the top row
+            if by_activity:
+                names = self.index.names(start, count)
+                return [self.tracker.get_task(name) for name in reversed(names)]
+            return self.tracker.newest_tasks(start, count)[::-1]
+
+    def eventFilter(self, watched, event):
+        if watched is self.canvas and event.type() == QEvent.Resize:
+            # rows fitting the axes, which keep their share of the figure
+            height = self.graph.ax.get_position().height * event.size().height()
+            visible_rows = max(int(height // self.row_height), 1)
+            if visible_rows != self.visible_rows:
+                self.visible_rows = visible_rows
+                # not before the first refresh, which loads the histories
+                if self.graph.last_full_update is not None:
+                    self.refresh_data(changed=())
+        return super().eventFilter(watched, event)
+
+    def _shown_changed(self, _):
+        self.scrollbar.blockSignals(True)
+        self.scrollbar.setValue(0)
+        self.scrollbar.blockSignals(False)
+        self.refresh_data(changed=())
+
+    def _on_scroll(self, event):
+        # the mouse wheel over the graph scrolls the rows
+        self.scrollbar.setValue(self.scrollbar.value() - int(event.step))
@@ -1,8 +1,5 @@
-from typing import List
-
 from PyQt5.QtWidgets import (
     QCheckBox,
-    QComboBox,
     QDialog,
     QLabel,
     QLineEdit,
@@ -10,21 +7,21 @@ from PyQt5.QtWidgets import (
     QVBoxLayout,
 )
 
-from app import Task
+from .task_model import TaskComboBox, TaskListModel
 
 
 class IncrementTaskUI(QDialog):
-    def __init__(self, tasks: List[Task]):
+    def __init__(self, tasks: TaskListModel):
         """
         Dialog window for increment a task currency.
 
         Args:
-            tasks (List[Task]): List of tasks to choose from.
+            tasks (TaskListModel): Tasks to choose from.
 
         """
         super().__init__()
 
-        self.options = [task.name for task in tasks]
+        self.tasks = tasks
 
         self.init_ui()
 
@@ -38,8 +35,7 @@ class IncrementTaskUI(QDialog):
 
         # create widgets
         self.name_label = QLabel("Task name: ")
-        self.task_combobox = QComboBox()
-        self.task_combobox.addItems(self.options)
+        self.task_combobox = TaskComboBox(self.tasks)
 
         self.checkbox = QCheckBox("Custom increment")
         self.increment_label = QLabel("Increment: ")
@@ -0,0 +1,90 @@
+import json
+import traceback
+
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtNetwork import QLocalServer, QLocalSocket
+
+from app.ipc import handle_request
+
+
+class TrackerServer(QObject):
+    show_requested = pyqtSignal()
+
+    def __init__(self, tracker, path: str, parent=None):
+        """
+        Local socket server running requests from other processes (see
+        'app.ipc') on the task tracker, in the Qt event loop.
+
+        Args:
+            tracker (TaskTracker): Task tracker to run the requests on.
+            path (str): Socket path (see 'app.ipc.socket_path').
+
+        """
+        super().__init__(parent)
+
+        self.tracker = tracker
+        self.path = path
+
+        self.server = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.UserAccessOption)
+        self.server.newConnection.connect(self._on_new_connection)
+
+        # pending bytes of each connection, until a full line is read
+        self._buffers = {}
+
+    def listen(self) -> bool:
+        """
+        Start listening. A socket left over by an instance that crashed is
+        replaced.
+
+        Returns (bool): Whether the server is listening.
+
+        """
+        QLocalServer.removeServer(self.path)
+        return self.server.listen(self.path)
+
+    def close(self):
+        """
+        Stop listening, and remove the socket.
+
+        """
+        self.server.close()
+
+    def _on_new_connection(self):
+        while self.server.hasPendingConnections():
+            connection = self.server.nextPendingConnection()
+            self._buffers[connection] = b''
+            connection.readyRead.connect(lambda connection=connection: self._on_ready_read(connection))
+            connection.disconnected.connect(lambda connection=connection: self._on_disconnected(connection))
+
+    def _on_disconnected(self, connection: QLocalSocket):
+        self._buffers.pop(connection, None)
+        connection.deleteLater()
+
+    def _on_ready_read(self, connection: QLocalSocket):
+        buffer = self._buffers.get(connection, b'') + bytes(connection.readAll())
+        *lines, self._buffers[connection] = buffer.split(b'\n')
+        for line in lines:
+            if line.strip():
+                # an exception escaping a Qt slot aborts the GUI
+                try:
+                    reply = self._handle(line)
+                except Exception as error:
+                    traceback.print_exc()
+                    reply = {"ok": False, "error": str(error)}
+                connection.write(json.dumps(reply).encode() + b'\n')
+        connection.flush()
+
+    def _handle(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {"ok": False, "error": "Malformed request."}
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "Malformed request."}
+
+        if request.get("command") == "show":
+            self.show_requested.emit()
+            return {"ok": True}
+
+        return handle_request(self.tracker, request)
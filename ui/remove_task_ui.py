@@ -1,28 +1,25 @@
-from typing import List
-
 from PyQt5.QtWidgets import (
-    QComboBox,
     QDialog,
     QLabel,
     QPushButton,
     QVBoxLayout,
 )
 
-from app import Task
+from .task_model import TaskComboBox, TaskListModel
 
 
 class RemoveTaskUI(QDialog):
-    def __init__(self, tasks: List[Task]):
+    def __init__(self, tasks: TaskListModel):
         """
         Dialog window for removing a task.
 
         Args:
-            tasks (List[Task]): List of tasks to choose from.
+            tasks (TaskListModel): Tasks to choose from.
 
         """
         super().__init__()
 
-        self.options = [task.name for task in tasks]
+        self.tasks = tasks
 
         self.init_ui()
 
@@ -36,8 +33,7 @@ class RemoveTaskUI(QDialog):
 
         # create widgets
         self.name_label = QLabel("Task name: ")
-        self.task_combobox = QComboBox()
-        self.task_combobox.addItems(self.options)
+        self.task_combobox = TaskComboBox(self.tasks)
 
         self.ok_button = QPushButton("OK", self)
         self.cancel_button = QPushButton("Cancel", self)
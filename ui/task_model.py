@@ -0,0 +1,241 @@
+import re
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from PyQt5.QtCore import (
+    QAbstractListModel,
+    QModelIndex,
+    Qt,
+    pyqtSignal,
+)
+from PyQt5.QtWidgets import QComboBox, QCompleter
+
+from app import ActivityIndex, TaskTracker
+
+_SEPARATOR = r'[\s\-_./]'
+_WORD_SEPARATORS = re.compile(_SEPARATOR + '+')
+
+
+def fuzzy_prefix_match(query: str, name: str) -> bool:
+    """
+    Check whether a search query matches a task name: the query, without
+    spaces or punctuation, has to be made of prefixes of the words of the name, in order,
+    e.g. "rebo" or "re bo" matches "reading books". Case insensitive.
+
+    Args:
+        query (str): Search query.
+        name (str): Task name.
+
+    Returns (bool): Whether the query matches.
+
+    """
+    return fuzzy_prefix_matcher(query)(name)
+
+
+def fuzzy_prefix_matcher(query: str) -> Callable[[str], bool]:
+    """
+    Compile a search query, to match many task names (see
+    'fuzzy_prefix_match').
+
+    Args:
+        query (str): Search query.
+
+    Returns (Callable[[str], bool]): Checks whether a task name matches.
+
+    """
+    query = ''.join(_WORD_SEPARATORS.split(query.lower()))
+    if not query:
+        return lambda name: True
+
+    # names without the query characters in order, the first one starting a
+    # word, are rejected without splitting them into words; each gap stops at
+    # the next character, so that the search doesn't backtrack
+    candidate = re.compile(rf'(?:^|{_SEPARATOR})' + re.escape(query[0]) +
+                           ''.join(f'[^{re.escape(char)}]*{re.escape(char)}' for char in query[1:]),
+                           re.IGNORECASE)
+
+    def match(name: str) -> bool:
+        if candidate.search(name) is None:
+            return False
+        words = [word for word in _WORD_SEPARATORS.split(name.lower()) if word]
+        return _match_words(query, words)
+    return match
+
+
+def _match_words(query: str, words: List[str]) -> bool:
+    # offsets of the query matched by prefixes of the words so far, in order;
+    # each word can match a prefix of the rest of the query from any of them
+    matched = {0}
+    for word in words:
+        for start in list(matched):
+            length = 0
+            while start + length < len(query) and length < len(word) and \
+                    query[start + length] == word[length]:
+                length += 1
+                matched.add(start + length)
+        if len(query) in matched:
+            return True
+    return False
+
+
+class TaskListModel(QAbstractListModel):
+    # change records of the task tracker, emitted from any thread
+    _records = pyqtSignal(list)
+
+    def __init__(self, tracker: TaskTracker, parent=None):
+        """
+        List model of the task names of a task tracker, most recently
+        incremented first, updated row by row as tasks change. Meant to be
+        shared by the views picking a task.
+
+        Args:
+            tracker (TaskTracker): Task tracker to list the tasks of.
+            parent (Optional[QObject]): Parent object.
+
+        """
+        super().__init__(parent)
+
+        self.tracker = tracker
+
+        # only updated on the GUI thread, along with the rows
+        self.activity = ActivityIndex(tracker)
+        self.activity.rebuild()
+
+        self._records.connect(self._apply)
+        tracker.add_listener(self._records.emit)
+
+    def rowCount(self, parent: QModelIndex=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.activity)
+
+    def data(self, index: QModelIndex, role: int=Qt.DisplayRole):
+        if index.isValid() and role in (Qt.DisplayRole, Qt.EditRole):
+            return self.activity.name_at(index.row())
+        return None
+
+    def refresh(self, names: Iterable[str]) -> None:
+        """
+        Update the rows of some tasks, e.g. after changes that are not notified
+        (see 'TaskTracker.merge').
+
+        Args:
+            names (Iterable[str]): Names of the changed tasks.
+
+        """
+        self._update(self.activity.refreshed(names))
+
+    def _apply(self, records: List[dict]) -> None:
+        for record in records:
+            self._update(self.activity.updates([record]))
+
+    def _update(self, updates: List[Tuple[str, Optional[tuple]]]) -> None:
+        for name, key in updates:
+            old = self.activity.position(name)
+            if key is None:
+                if old is not None:
+                    self.beginRemoveRows(QModelIndex(), old, old)
+                    self.activity.update(name, None)
+                    self.endRemoveRows()
+                continue
+
+            new = self.activity.insertion_point(key)
+            if old is None:
+                self.beginInsertRows(QModelIndex(), new, new)
+                self.activity.update(name, key)
+                self.endInsertRows()
+            elif new in (old, old + 1):
+                # same row
+                self.activity.update(name, key)
+            else:
+                self.beginMoveRows(QModelIndex(), old, old, QModelIndex(), new)
+                self.activity.update(name, key)
+                self.endMoveRows()
+
+
+class TaskFilterModel(QAbstractListModel):
+    def __init__(self, tasks: TaskListModel, max_matches: int=50, parent=None):
+        """
+        List model of the tasks matching a search query (see
+        'fuzzy_prefix_match'), most recently incremented first. Only the first
+        matches are kept, so that searching stays fast with many tasks.
+
+        Args:
+            tasks (TaskListModel): Tasks to search.
+            max_matches (int): Number of matches kept. Defaults to 50.
+            parent (Optional[QObject]): Parent object.
+
+        """
+        super().__init__(parent)
+
+        self.tasks = tasks
+        self.max_matches = max_matches
+        self.query = ''
+        self._matches = []
+
+        for signal in (tasks.rowsInserted, tasks.rowsRemoved, tasks.rowsMoved, tasks.modelReset):
+            signal.connect(self._refilter)
+        self._refilter()
+
+    def rowCount(self, parent: QModelIndex=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._matches)
+
+    def data(self, index: QModelIndex, role: int=Qt.DisplayRole):
+        if index.isValid() and role in (Qt.DisplayRole, Qt.EditRole):
+            return self._matches[index.row()]
+        return None
+
+    def set_query(self, query: str) -> None:
+        """
+        Search the tasks with a new query.
+
+        Args:
+            query (str): Search query.
+
+        """
+        self.query = query
+        self._refilter()
+
+    def _refilter(self, *_) -> None:
+        if not self.query.strip():
+            matches = self.tasks.activity.names(0, self.max_matches)
+        else:
+            matches = []
+            match = fuzzy_prefix_matcher(self.query)
+            for name in self.tasks.activity.names():
+                if match(name):
+                    matches.append(name)
+                    if len(matches) == self.max_matches:
+                        break
+        self.beginResetModel()
+        self._matches = matches
+        self.endResetModel()
+
+
+class TaskComboBox(QComboBox):
+    def __init__(self, tasks: TaskListModel, parent=None):
+        """
+        Editable combo box to pick a task, most recently incremented first,
+        suggesting the tasks matching the typed text.
+
+        Args:
+            tasks (TaskListModel): Tasks to pick from.
+            parent (Optional[QWidget]): Parent widget.
+
+        """
+        super().__init__(parent)
+
+        self.setEditable(True)
+        self.setInsertPolicy(QComboBox.NoInsert)
+        # don't measure every task
+        self.setSizeAdjustPolicy(QComboBox.AdjustToMinimumContentsLengthWithIcon)
+        self.view().setUniformItemSizes(True)
+        self.setModel(tasks)
+
+        # suggestions are the matches of the typed text, shown as they are
+        self.filter_model = TaskFilterModel(tasks, parent=self)
+        completer = QCompleter(self.filter_model, self)
+        completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        completer.setCaseSensitivity(Qt.CaseInsensitive)
+        self.setCompleter(completer)
+
+        self.lineEdit().textEdited.connect(self.filter_model.set_query)
+        # typing replaces the preselected task
+        self.lineEdit().selectAll()
@@ -1,3 +1,4 @@
+from PyQt5.QtCore import QEvent, QTimer, pyqtSignal
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import (
     QAction,
@@ -15,9 +16,19 @@ from .add_task_ui import AddTaskUI
 from .remove_task_ui import RemoveTaskUI
 from .increment_task_ui import IncrementTaskUI
 from .graph_ui import GraphUI
+from .task_model import TaskListModel
+
+# shortest time between two graph refreshes, one frame at 60 fps
+FRAME_INTERVAL = 16
 
 
 class TaskTrackerUI(QWidget):
+    # names of changed tasks, can be emitted from any thread
+    tasks_changed = pyqtSignal(list)
+    # names of the tasks changed without change records (e.g. merged from
+    # other processes, see 'TaskTracker.merge'), can be emitted from any thread
+    tasks_merged = pyqtSignal(list)
+
     def __init__(self, tracker, app):
         """
         Main Tracker UI interface.
@@ -30,12 +41,30 @@ class TaskTrackerUI(QWidget):
 
         self.app = app
 
+        # task names, shared by the dialogs picking a task
+        self.task_model = TaskListModel(tracker, self)
+
+        # changed tasks, refreshed together at most once per frame, and not
+        # while the window is hidden
+        self._pending_changes = set()
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(FRAME_INTERVAL)
+        self.refresh_timer.timeout.connect(self._refresh_pending)
+        self.tasks_changed.connect(self.schedule_refresh)
+        # the task model follows the change records on its own
+        self.tasks_merged.connect(self.schedule_refresh)
+        self.tasks_merged.connect(self.task_model.refresh)
+
+        # every change to the tracker, from the UI or from another thread
+        tracker.add_listener(self._on_records)
+
         self.init_ui()
 
     def init_ui(self):
         # set window properties
         app_icon = QIcon('resources/images/tracker.png')
-        self.setFixedSize(1400, 900)
+        self.resize(1400, 900)
         self.setWindowTitle("Progress tracker")
         self.setWindowIcon(app_icon)
 
@@ -66,7 +95,8 @@ class TaskTrackerUI(QWidget):
         self.increment_button.setAutoDefault(True)
 
         # create plot
-        self.plot_ui = GraphUI()
+        self.plot_ui = GraphUI(self.tracker)
+        self.plot_ui.graph.retention = self.tracker.retention
 
         # set the layout
         hbox = QHBoxLayout()
@@ -95,8 +125,9 @@ class TaskTrackerUI(QWidget):
         # handle window close event (minimize to tray)
         self.closeEvent = self.on_close_event
 
-        self.plot_ui.refresh_data(self.tracker.tasks)
+        # show the window first, the first refresh loads the task histories
         self.show()
+        QTimer.singleShot(0, self.plot_ui.refresh_data)
 
     def add_task_dialog(self):
         """
@@ -121,15 +152,12 @@ class TaskTrackerUI(QWidget):
 
             QMessageBox.information(self, "Success", f"Task \"{task_name}\" added!")
 
-        # refresh graph data
-        self.plot_ui.refresh_data(self.tracker.tasks)
-
     def remove_task(self):
         """
         Remove a task through the UI.
 
         """
-        dialog = RemoveTaskUI(self.tracker.tasks)
+        dialog = RemoveTaskUI(self.task_model)
         result = dialog.exec_()
 
         if result == QDialog.Accepted:
@@ -150,18 +178,13 @@ class TaskTrackerUI(QWidget):
                     QMessageBox.information(self, "Success", f"Task \"{task_name}\" removed!")
                 else:
                     QMessageBox.warning(self, "Warning", f"No such task \"{task_name}\"!")
-            else:
-                return
-
-        # refresh graph data
-        self.plot_ui.refresh_data(self.tracker.tasks)
 
     def update_task_dialog(self):
         """
         Update a task through the UI.
 
         """
-        dialog = IncrementTaskUI(self.tracker.tasks)
+        dialog = IncrementTaskUI(self.task_model)
         result = dialog.exec_()
 
         if result == QDialog.Accepted:
@@ -192,14 +215,64 @@ class TaskTrackerUI(QWidget):
 
             QMessageBox.information(self, "Success", f"Task \"{task_name}\" updated!")
 
-        # refresh graph data
-        self.plot_ui.refresh_data(self.tracker.tasks)
+    def schedule_refresh(self, task_names):
+        """
+        Mark tasks as changed, and refresh the graph by the next frame, once for
+        all the changes marked in the meantime. Nothing is refreshed while the
+        window is hidden, until it is shown again.
+
+        Args:
+            task_names (List[str]): Names of the changed tasks.
+
+        """
+        self._pending_changes.update(task_names)
+        if not self._hidden() and not self.refresh_timer.isActive():
+            self.refresh_timer.start()
+
+    def _on_records(self, records):
+        # tracker listener, possibly called from another thread
+        self.tasks_changed.emit([record["task"]["name"] if record["op"] == "add"
+                                 else record["name"] for record in records])
+
+    def _hidden(self):
+        return self.isHidden() or self.isMinimized()
+
+    def _refresh_pending(self):
+        if self._hidden():
+            return
+        changed, self._pending_changes = self._pending_changes, set()
+        self.plot_ui.refresh_data(changed=changed)
+
+    def _catch_up(self):
+        # single refresh for the changes marked while hidden
+        if self._pending_changes:
+            self.refresh_timer.stop()
+            self._refresh_pending()
+
+    def show_window(self):
+        """
+        Show the window, restoring it from the system tray if needed.
+
+        """
+        self.tray_icon.hide()
+        if self.isMinimized():
+            self.showNormal()
+        else:
+            self.show()
+        self.raise_()
+        self.activateWindow()
+        self._catch_up()
 
     def tray_icon_activated(self, reason):
         # restore app from system tray icon
         if reason == QSystemTrayIcon.Trigger:
-            self.tray_icon.hide()
-            self.show()
+            self.show_window()
+
+    def changeEvent(self, event):
+        # restored from minimized
+        if event.type() == QEvent.WindowStateChange and not self._hidden():
+            self._catch_up()
+        super().changeEvent(event)
 
     def on_close_event(self, event):
         # minimize to tray when closing window